@@ -1,14 +1,18 @@
 #!/usr/bin/env python3
 
+import http.client
 import http.cookiejar
 import json
 import os
 import ssl
 import sys
+import threading
 import time
 import urllib.error
 import urllib.parse
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 # Configuration
 QUAY_HOST = os.getenv("QUAY_HOST")
@@ -16,17 +20,91 @@ USERNAME = os.getenv("QUAY_ADMIN_USER", "username")
 EMAIL = os.getenv("QUAY_ADMIN_EMAIL", "user@example.com")
 PASSWORD = os.getenv("QUAY_ADMIN_PASSWORD")
 CA_CERT = os.getenv("CA_CERT", "/run/secrets/kubernetes.io/serviceaccount/ca.crt")
+# Plain "http" is only meant for local stand-ins (scripts/bench-quay-bootstrap.py)
+SCHEME = os.getenv("QUAY_SCHEME", "https")
+
+# Readiness polling: probe quickly first, back off exponentially up to the cap,
+# and give up once the overall deadline has passed.
+WAIT_TIMEOUT = float(os.getenv("QUAY_WAIT_TIMEOUT", "600"))
+POLL_INITIAL = float(os.getenv("QUAY_POLL_INITIAL", "0.5"))
+POLL_MAX = float(os.getenv("QUAY_POLL_MAX", "2"))
+
+# Optional organization (owned by USERNAME) and robot accounts to reconcile
+ORGANIZATION = os.getenv("QUAY_ORGANIZATION", "")
+ROBOTS = [r.strip() for r in os.getenv("QUAY_ROBOTS", "").split(",") if r.strip()]
+
+# Create the first user through /api/v1/user/initialize (requires
+# FEATURE_USER_INITIALIZE on an empty Quay) and use its OAuth token afterwards
+INITIALIZE = os.getenv("QUAY_INITIALIZE", "false").lower() == "true"
+MAX_WORKERS = int(os.getenv("QUAY_MAX_WORKERS", "8"))
+
+# Output: "text" or "json" (one JSON object per line), plus an optional local
+# file receiving the final summary object (the chart relies on the job log)
+LOG_FORMAT = os.getenv("QUAY_LOG_FORMAT", "text")
+REPORT_FILE = os.getenv("QUAY_REPORT_FILE", "")
 
 if not all([QUAY_HOST, PASSWORD]):
     print("ERROR: Missing QUAY_HOST or QUAY_ADMIN_PASSWORD env vars")
     sys.exit(1)
 
-BASE_URL = f"https://{QUAY_HOST}"
+BASE_URL = f"{SCHEME}://{QUAY_HOST}"
 
 
-def log(msg):
+def log(msg, **fields):
     """Log a message to the console"""
-    print(f"[{time.strftime('%X')}] {msg}", flush=True)
+    if LOG_FORMAT == "json":
+        record = {"ts": round(time.time(), 3), "msg": msg, **fields}
+        print(json.dumps(record), flush=True)
+    else:
+        print(f"[{time.strftime('%X')}] {msg}", flush=True)
+
+
+# Per-phase timing: name -> {"seconds": total, "count": calls}. Phases may nest
+# (csrf runs inside user and signin), so their totals are not additive.
+report = {"phases": {}, "requests": 0, "attempts": 0, "time_to_ready": None}
+report_lock = threading.Lock()
+
+
+@contextmanager
+def phase(name, **fields):
+    """Time a bootstrap phase and log it as a structured event"""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - start
+        with report_lock:
+            entry = report["phases"].setdefault(name, {"seconds": 0.0, "count": 0})
+            entry["seconds"] += elapsed
+            entry["count"] += 1
+        if LOG_FORMAT == "json":
+            log("phase", event="phase", phase=name, seconds=round(elapsed, 3), **fields)
+
+
+def count_request():
+    with report_lock:
+        report["requests"] += 1
+
+
+def write_summary(result, total):
+    """Emit the final summary object and optionally save it to REPORT_FILE"""
+    summary = {
+        "event": "summary",
+        "result": result,
+        "total_seconds": round(total, 3),
+        "time_to_ready": report["time_to_ready"],
+        "attempts": report["attempts"],
+        "requests": report["requests"],
+        "phases": {
+            name: {"seconds": round(entry["seconds"], 3), "count": entry["count"]}
+            for name, entry in report["phases"].items()
+        },
+    }
+    print(json.dumps(summary), flush=True)
+    if REPORT_FILE:
+        with open(REPORT_FILE, "w") as fh:
+            json.dump(summary, fh, indent=2)
+    return summary
 
 
 # Setup SSL
@@ -48,77 +126,334 @@ opener = urllib.request.build_opener(
     urllib.request.HTTPCookieProcessor(cj),
 )
 
+# OAuth access token returned by the initialize endpoint. Once set, API calls
+# use bearer auth over pooled keep-alive connections instead of the cookie
+# session, so they need no CSRF token and can run in parallel.
+access_token = None
+connections = threading.local()
+
+
+def backoff_delays(initial=POLL_INITIAL, maximum=POLL_MAX, factor=2.0):
+    """Yield exponentially growing sleep intervals capped at maximum"""
+    delay = initial
+    while True:
+        yield delay
+        delay = min(delay * factor, maximum)
+
+
+def decode(status, body):
+    """Return (status, decoded JSON body or None)"""
+    try:
+        return status, json.loads(body.decode())
+    except ValueError:
+        return status, None
+
+
+# Methods that are safe to send again when the outcome of a request is unknown
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})
+
+
+def pooled_json(path, method="GET", payload=None):
+    """Call a Quay endpoint over this thread's keep-alive connection"""
+    headers = {}
+    data = None
+    if payload is not None:
+        data = json.dumps(payload).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    if access_token:
+        headers["Authorization"] = f"Bearer {access_token}"
+    count_request()
+    for attempt in range(2):
+        conn = getattr(connections, "conn", None)
+        if conn is None:
+            if SCHEME == "https":
+                conn = http.client.HTTPSConnection(QUAY_HOST, timeout=10, context=ctx)
+            else:
+                conn = http.client.HTTPConnection(QUAY_HOST, timeout=10)
+            connections.conn = conn
+        sent = False
+        try:
+            conn.request(method, path, body=data, headers=headers)
+            sent = True
+            response = conn.getresponse()
+            return decode(response.status, response.read())
+        except (http.client.HTTPException, OSError):
+            # The server may drop an idle kept-alive connection; reconnect once,
+            # unless a non-idempotent request may already have reached Quay
+            conn.close()
+            connections.conn = None
+            if attempt or (sent and method not in IDEMPOTENT_METHODS):
+                raise
+
+
+def fetch_json(path, method="GET", payload=None, csrf_token=None):
+    """Call a Quay endpoint and return (status, decoded JSON body or None)"""
+    if access_token and path.startswith("/api/"):
+        return pooled_json(path, method, payload)
+    url = f"{BASE_URL}{path}"
+    headers = {}
+    data = None
+    if payload is not None:
+        data = json.dumps(payload).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    if csrf_token:
+        headers["X-CSRF-Token"] = csrf_token
+    req = urllib.request.Request(url, data=data, headers=headers, method=method)
+    count_request()
+    try:
+        with opener.open(req, timeout=10) as response:
+            status, body = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        # Health endpoints report failing services in the body of a 503,
+        # and API errors carry their reason in the body as well
+        status, body = e.code, e.read()
+    return decode(status, body)
+
+
+def quay_ready():
+    """Return (ready, reason) for the endpoints the user API depends on"""
+    status, _ = fetch_json("/health/instance")
+    if status != 200:
+        return False, f"/health/instance returned {status}"
+
+    # /health/endtoend also covers the database; only the database is needed
+    # for account creation, so an unrelated storage failure does not block us.
+    status, data = fetch_json("/health/endtoend")
+    services = ((data or {}).get("data") or {}).get("services") or {}
+    if "database" in services:
+        if not services["database"]:
+            return False, "database is not ready"
+    elif status != 200:
+        return False, f"/health/endtoend returned {status}"
+
+    status, data = fetch_json("/csrf_token")
+    if status != 200 or not (data or {}).get("csrf_token"):
+        return False, f"/csrf_token returned {status}"
+    return True, "ready"
 
-def wait_for_quay():
-    """Loop until Quay health endpoint returns 200"""
-    url = f"{BASE_URL}/health/instance"
+
+@phase("wait")
+def wait_for_quay(timeout=WAIT_TIMEOUT):
+    """Poll Quay with backoff until it is ready; return seconds waited or None"""
+    log(f"Checking Quay readiness at {BASE_URL} (timeout {timeout:.0f}s)...")
+    start = time.monotonic()
+    delays = backoff_delays()
     while True:
         try:
-            log(f"Checking Quay health at {url}...")
-            with opener.open(url, timeout=10) as response:
-                if response.status == 200:
-                    log("Quay is Online.")
-                    return
+            ready, reason = quay_ready()
         except Exception as e:
-            log(f"Quay unavailable ({e}). Retrying in 5s...")
-            time.sleep(5)
+            ready, reason = False, str(e)
+        elapsed = time.monotonic() - start
+        if ready:
+            report["time_to_ready"] = round(elapsed, 3)
+            log(f"Quay is Online (time-to-ready {elapsed:.1f}s).")
+            return elapsed
+        remaining = timeout - elapsed
+        if remaining <= 0:
+            log(f"ERROR: Quay not ready after {elapsed:.1f}s ({reason}).")
+            return None
+        delay = min(next(delays), remaining)
+        log(f"Quay unavailable ({reason}). Retrying in {delay:.1f}s...")
+        time.sleep(delay)
 
 
+@phase("csrf")
 def get_csrf_token():
     """Fetch CSRF token and prime the cookie jar"""
-    url = f"{BASE_URL}/csrf_token"
-    with opener.open(url) as response:
-        data = json.loads(response.read().decode())
-        token = data.get("csrf_token")
-    return token
+    status, data = fetch_json("/csrf_token")
+    if status != 200 or not (data or {}).get("csrf_token"):
+        raise RuntimeError(f"/csrf_token returned {status}")
+    return data["csrf_token"]
+
+
+def error_detail(data):
+    """Extract Quay's error message from an API error body"""
+    data = data or {}
+    return data.get("error_message") or data.get("message") or data.get("detail")
+
 
+# Reconciled resource state: API path -> JSON body, or None when missing.
+# Positive results are kept for the whole run so retries only re-read what
+# still has to be written.
+resource_cache = {}
 
+
+def lookup(path, missing=(404,)):
+    """GET an API resource once and cache its body (None when it is missing)"""
+    if path not in resource_cache:
+        with phase("lookup", path=path):
+            status, data = fetch_json(path)
+        if status == 200:
+            resource_cache[path] = data
+        elif status in missing:
+            resource_cache[path] = None
+        else:
+            raise RuntimeError(f"GET {path} returned {status}: {error_detail(data)}")
+    return resource_cache[path]
+
+
+@phase("user")
 def create_user():
     """Perform the creation flow"""
-    try:
-        log("Attempting to create user...")
-        csrf_token = get_csrf_token()
-
-        url = f"{BASE_URL}/api/v1/user/"
-        payload = json.dumps(
-            {
-                "username": USERNAME,
-                "email": EMAIL,
-                "password": PASSWORD,
-                "_csrf_token": csrf_token,
-            }
-        ).encode("utf-8")
-
-        headers = {
-            "Content-Type": "application/json",
-            "X-CSRF-Token": csrf_token,
-        }
-
-        req = urllib.request.Request(url, data=payload, headers=headers, method="POST")
-
-        with opener.open(req) as response:
-            if response.status in [200, 201, 202]:
-                log("SUCCESS: User created successfully.")
-                return True
-    except urllib.error.HTTPError as e:
-        if e.code == 400:
-            log(f"User '{USERNAME}' already exists. Exiting.")
-            return True
-        log(f"FAILED to create user: {e.code} {e.reason}")
-    except Exception as e:
-        log(f"FAILED to create user: {e}")
+    log(f"Creating user '{USERNAME}'...")
+    csrf_token = get_csrf_token()
+    payload = {
+        "username": USERNAME,
+        "email": EMAIL,
+        "password": PASSWORD,
+        "_csrf_token": csrf_token,
+    }
+    status, data = fetch_json("/api/v1/user/", "POST", payload, csrf_token)
+    if status in [200, 201, 202]:
+        log("SUCCESS: User created successfully.")
+        return True
+
+    # A 400 is only a no-op if the user really exists (e.g. a concurrent run)
+    user_path = f"/api/v1/users/{USERNAME}"
+    resource_cache.pop(user_path, None)
+    if status == 400 and lookup(user_path) is not None:
+        log(f"User '{USERNAME}' already exists.")
+        return True
+    log(f"FAILED to create user: {status} {error_detail(data)}")
     return False
 
 
-# Main
-if __name__ == "__main__":
+@phase("initialize")
+def initialize_user():
+    """Create the first user and keep its access token.
+
+    Returns True on success, False when Quay refuses (feature disabled or
+    database not empty) so the caller can fall back to create_user().
+    """
+    global access_token
+
+    log(f"Initializing first user '{USERNAME}'...")
+    payload = {
+        "username": USERNAME,
+        "email": EMAIL,
+        "password": PASSWORD,
+        "access_token": True,
+    }
+    status, data = pooled_json("/api/v1/user/initialize", "POST", payload)
+    if status == 200 and (data or {}).get("access_token"):
+        access_token = data["access_token"]
+        log("SUCCESS: User initialized, using its access token.")
+        return True
+    log(f"User initialize unavailable: {status} {error_detail(data)}")
+    return False
+
+
+@phase("signin")
+def sign_in():
+    """Start an authenticated session as USERNAME; return a fresh CSRF token"""
+    csrf_token = get_csrf_token()
+    payload = {"username": USERNAME, "password": PASSWORD}
+    status, data = fetch_json("/api/v1/signin", "POST", payload, csrf_token)
+    if status != 200 or not (data or {}).get("success"):
+        raise RuntimeError(f"sign-in failed: {status} {error_detail(data)}")
+    # The session cookie changes on sign-in, and with it the CSRF token
+    return get_csrf_token()
+
+
+def write(method, path, payload, csrf_token, what):
+    """Issue a write for a missing or drifted resource and cache the result"""
+    with phase("write", path=path):
+        status, data = fetch_json(path, method, payload, csrf_token)
+    if status not in [200, 201, 202, 204]:
+        log(f"FAILED to {what}: {status} {error_detail(data)}")
+        return False
+    log(f"SUCCESS: {what}.")
+    resource_cache.pop(path, None)
+    return True
+
+
+def reconcile():
+    """Bring the user, organization and robots to the desired state.
+
+    Every resource is checked with a cheap GET first and only missing objects
+    are created, so a converged Quay costs a few reads.  The user's email is
+    only set when the user is created; an existing user is left as it is.
+    """
+    user_path = f"/api/v1/users/{USERNAME}"
+    if lookup(user_path) is None:
+        if not (INITIALIZE and initialize_user()) and not create_user():
+            return False
+        resource_cache[user_path] = {"username": USERNAME}
+    else:
+        log(f"User '{USERNAME}' already exists.")
+
+    if not ORGANIZATION:
+        return True
+
+    # Bearer-token calls need neither a session nor CSRF tokens
+    csrf_token = None if access_token else sign_in()
+
+    org_path = f"/api/v1/organization/{ORGANIZATION}"
+    if lookup(org_path) is None:
+        if not write(
+            "POST",
+            "/api/v1/organization/",
+            {"name": ORGANIZATION},
+            csrf_token,
+            f"create organization '{ORGANIZATION}'",
+        ):
+            return False
+    else:
+        log(f"Organization '{ORGANIZATION}' already exists.")
+
+    def ensure_robot(robot):
+        robot_path = f"{org_path}/robots/{robot}"
+        # Quay answers 400 for a robot that does not exist in older releases
+        if lookup(robot_path, missing=(400, 404)) is not None:
+            log(f"Robot '{ORGANIZATION}+{robot}' already exists.")
+            return True
+        return write(
+            "PUT",
+            robot_path,
+            {"description": f"Managed by {USERNAME} provisioner"},
+            csrf_token,
+            f"create robot '{ORGANIZATION}+{robot}'",
+        )
+
+    if access_token and len(ROBOTS) > 1:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            results = list(pool.map(ensure_robot, ROBOTS))
+    else:
+        results = [ensure_robot(robot) for robot in ROBOTS]
+    return all(results)
+
+
+def main():
+    """Wait for Quay, then reconcile with backoff until converged or timed out"""
     log("Starting Quay User Automator")
 
-    wait_for_quay()
+    start = time.monotonic()
+    if wait_for_quay() is None:
+        return False
 
+    delays = backoff_delays()
     while True:
-        if create_user():
-            sys.exit(0)
+        report["attempts"] += 1
+        try:
+            if reconcile():
+                log("Quay is reconciled.")
+                return True
+        except Exception as e:
+            log(f"FAILED to reconcile: {e}")
 
-        log("Retrying user creation in 10s...")
-        time.sleep(10)
+        remaining = WAIT_TIMEOUT - (time.monotonic() - start)
+        if remaining <= 0:
+            log(f"ERROR: Giving up on reconciliation after {WAIT_TIMEOUT:.0f}s.")
+            return False
+        delay = min(next(delays), remaining)
+        log(f"Retrying reconciliation in {delay:.1f}s...")
+        with phase("retry"):
+            time.sleep(delay)
+
+
+# Main
+if __name__ == "__main__":
+    started = time.monotonic()
+    ok = main()
+    write_summary("success" if ok else "failed", time.monotonic() - started)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""Benchmark the feature variant generator on synthetic values at increasing scale.
+
+For each scale N a base values file and a set of feature fragments are
+synthesized: N applications with override lists, N namespaces, N/10
+subscriptions, and fragments that add namespaces, subscriptions and
+applications, upsert overrides into existing applications through
+merge_into_applications and contribute vault JWT roles.  The generator's
+parse, merge, validate and dump phases are timed separately and, in a second
+pass under tracemalloc, their peak memory is measured, so changes to the
+generator can be checked for scaling regressions.
+
+Usage:
+  # Default scales, one run each
+  python3 scripts/bench-feature-variants.py
+
+  # Median of 3 runs at custom scales, saved as JSON
+  python3 scripts/bench-feature-variants.py --scales 500,5000 --runs 3 --json \\
+      > /tmp/bench.json
+
+  # Compare against a previous JSON result, fail on a >50% slowdown
+  python3 scripts/bench-feature-variants.py --compare /tmp/bench.json --tolerance 1.5
+"""
+
+import argparse
+import copy
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from feature_variants import (
+    REPO_ROOT,
+    FragmentMerger,
+    dump_yaml,
+    load_feature_registry,
+    load_fragment_file,
+    load_yaml_cached,
+    load_yaml_file,
+    plan_matrix,
+    render_variant,
+    validate_output,
+)
+from feature_variants.matrix import job_inputs
+from feature_variants.yamlio import _parsed_cache, _strip_comments, output_yaml
+
+PHASES = ("parse", "merge", "validate", "dump")
+
+
+def synthesize_base(scale, overrides):
+    """Return a base values tree with scale applications and namespaces."""
+    namespaces = {f"ns-{i}": None for i in range(scale)}
+    namespaces["vault"] = None
+    subscriptions = {
+        f"sub-{i}": {
+            "name": f"operator-{i}",
+            "namespace": f"ns-{i}",
+            "channel": "stable",
+        }
+        for i in range(max(1, scale // 10))
+    }
+    applications = {
+        "vault": {
+            "name": "vault",
+            "namespace": "vault",
+            "project": "hub",
+            "chart": "hashicorp-vault",
+            "chartVersion": "0.1.*",
+        }
+    }
+    for i in range(scale):
+        applications[f"app-{i}"] = {
+            "name": f"app-{i}",
+            "namespace": f"ns-{i}",
+            "project": "hub",
+            "path": f"charts/app-{i}",
+            "overrides": [
+                {"name": f"app.setting{j}", "value": f"value-{j}"}
+                for j in range(overrides)
+            ],
+        }
+    return {
+        "global": {"pattern": "bench", "options": {"syncPolicy": "Automatic"}},
+        "main": {"clusterGroupName": "hub"},
+        "clusterGroup": {
+            "name": "hub",
+            "isHubCluster": True,
+            "namespaces": namespaces,
+            "subscriptions": subscriptions,
+            "applications": applications,
+        },
+    }
+
+
+def synthesize_fragment(index, scale, overrides):
+    """Return fragment index: new resources plus merges into 1 in 5 apps."""
+    new = max(1, scale // 20)
+    apps = {
+        f"feature-{index}-app-{i}": {
+            "name": f"feature-{index}-app-{i}",
+            "namespace": f"feature-{index}-ns-{i}",
+            "project": "hub",
+            "path": f"charts/feature-{index}-{i}",
+        }
+        for i in range(new)
+    }
+    merge_into = {
+        "vault": {
+            "jwt": {
+                "roles": [
+                    {
+                        "name": f"feature-{index}-role-{i}",
+                        "audience": f"feature-{index}",
+                        "policies": [f"feature-{index}-secret"],
+                    }
+                    for i in range(3)
+                ]
+            }
+        }
+    }
+    for i in range(index % 5, scale, 5):
+        merge_into[f"app-{i}"] = {
+            "overrides": [
+                # Replaces an existing override and adds new ones
+                {"name": f"app.setting{index % max(1, overrides)}", "value": "true"},
+                {"name": f"feature{index}.enabled", "value": "true"},
+            ]
+        }
+    return {
+        f"feature{index}": {"enabled": True},
+        "clusterGroup": {
+            "namespaces": {
+                **{f"feature-{index}-ns-{i}": None for i in range(new)},
+                f"ns-{index}": {"labels": {f"feature-{index}": "enabled"}},
+            },
+            "subscriptions": {
+                f"feature-{index}-sub": {
+                    "name": f"feature-{index}-operator",
+                    "namespace": f"feature-{index}-ns-0",
+                }
+            },
+            "applications": apps,
+            "merge_into_applications": merge_into,
+        },
+    }
+
+
+def write_inputs(workdir, scale, fragments, overrides):
+    """Write the synthetic base and fragments as YAML, return their paths."""
+    yaml = output_yaml()
+    base_path = os.path.join(workdir, f"values-hub-{scale}.yaml")
+    with open(base_path, "w") as fh:
+        yaml.dump(synthesize_base(scale, overrides), fh)
+    frag_paths = []
+    for i in range(fragments):
+        path = os.path.join(workdir, f"feature-{scale}-{i}.yaml")
+        with open(path, "w") as fh:
+            yaml.dump(synthesize_fragment(i, scale, overrides), fh)
+        frag_paths.append(path)
+    return base_path, frag_paths
+
+
+def run_phases(base_path, frag_paths, measure):
+    """Run parse, merge, validate and dump once, measuring each with measure."""
+    results = {}
+    with measure("parse", results):
+        base = load_yaml_file(base_path)
+        fragments = [load_fragment_file(p) for p in frag_paths]
+    with measure("merge", results):
+        # Same work as render_variant: copy the cached base, merge fragments
+        merged = copy.deepcopy(base)
+        merger = FragmentMerger(merged)
+        for fragment in fragments:
+            merger.merge(fragment)
+    with measure("validate", results):
+        problems = validate_output(merged)
+        cg = merged["clusterGroup"]
+        for key in ("namespaces", "subscriptions", "applications"):
+            _strip_comments(cg[key])
+    with measure("dump", results):
+        text = dump_yaml(merged)
+    if problems:
+        raise RuntimeError(f"synthetic inputs failed validation: {problems}")
+    return results, len(text), len(merger.vault_jwt_roles)
+
+
+class timed:
+    """measure() for run_phases: wall time in seconds."""
+
+    def __init__(self, phase, results):
+        self.phase = phase
+        self.results = results
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.results[self.phase] = time.perf_counter() - self.start
+
+
+class traced:
+    """measure() for run_phases: peak traced memory in bytes."""
+
+    def __init__(self, phase, results):
+        self.phase = phase
+        self.results = results
+
+    def __enter__(self):
+        tracemalloc.reset_peak()
+        self.start = tracemalloc.get_traced_memory()[0]
+
+    def __exit__(self, *exc):
+        self.results[self.phase] = tracemalloc.get_traced_memory()[1] - self.start
+
+
+def bench_scale(scale, fragments, overrides, runs, memory=True):
+    """Benchmark one scale and return its aggregated result."""
+    with tempfile.TemporaryDirectory(prefix="bench-feature-variants-") as workdir:
+        base_path, frag_paths = write_inputs(workdir, scale, fragments, overrides)
+        input_bytes = sum(os.path.getsize(p) for p in [base_path, *frag_paths])
+
+        samples = {phase: [] for phase in PHASES}
+        for _ in range(runs):
+            seconds, output_bytes, roles = run_phases(base_path, frag_paths, timed)
+            for phase in PHASES:
+                samples[phase].append(seconds[phase])
+
+        peaks = {}
+        if memory:
+            tracemalloc.start()
+            try:
+                peaks, _, _ = run_phases(base_path, frag_paths, traced)
+            finally:
+                tracemalloc.stop()
+
+    return {
+        "scale": scale,
+        "fragments": fragments,
+        "overrides": overrides,
+        "runs": runs,
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "vault_jwt_roles": roles,
+        "seconds": {p: round(statistics.median(samples[p]), 4) for p in PHASES},
+        "peak_mib": {p: round(peaks[p] / 2**20, 1) for p in peaks},
+    }
+
+
+def print_table(rows):
+    print(
+        f"{'scale':>6s} {'input(KiB)':>10s}"
+        + "".join(f" {p + '(s)':>11s}" for p in PHASES)
+        + "".join(f" {p + '(MiB)':>13s}" for p in PHASES)
+    )
+    for row in rows:
+        print(
+            f"{row['scale']:6d} {row['input_bytes'] / 1024:10.0f}"
+            + "".join(f" {row['seconds'][p]:11.3f}" for p in PHASES)
+            + "".join(f" {row['peak_mib'].get(p, '-'):>13}" for p in PHASES)
+        )
+
+
+def compare(rows, baseline_rows, tolerance):
+    """Return the phases that are slower than tolerance x the baseline."""
+    baseline = {row["scale"]: row for row in baseline_rows}
+    regressions = []
+    for row in rows:
+        old = baseline.get(row["scale"])
+        if old is None:
+            continue
+        for phase in PHASES:
+            before = old["seconds"].get(phase)
+            after = row["seconds"][phase]
+            if before and after > before * tolerance:
+                regressions.append(
+                    f"scale {row['scale']} {phase}: {before:.3f}s -> {after:.3f}s"
+                    f" ({after / before:.2f}x)"
+                )
+    return regressions
+
+
+FRAGMENT_LOADERS = {"round-trip": load_yaml_file, "fast": load_fragment_file}
+
+
+def bench_loaders(runs):
+    """Time the --matrix workload with each fragment loader, from a cold cache.
+
+    parse is loading every fragment once (what each matrix worker does at
+    start), render is rendering and serializing all matrix variants
+    in-process.  The outputs of both loaders are compared.
+    """
+    base = os.path.join(REPO_ROOT, "values-hub.yaml")
+    feature_defs, registry_opts = load_feature_registry()
+    # A Git URL so the protected-repos sets are included too
+    jobs = plan_matrix(
+        base, "", feature_defs, registry_opts, None, "https://git.example.com/q.git"
+    )[1]
+    frag_paths = sorted(set().union(*(job_inputs(job) for job in jobs)) - {base})
+
+    rows, outputs = [], {}
+    for name, loader in FRAGMENT_LOADERS.items():
+        samples = {"parse": [], "render": []}
+        for _ in range(runs):
+            _parsed_cache.clear()
+            load_yaml_cached(base)
+            start = time.perf_counter()
+            for path in frag_paths:
+                load_yaml_cached(path, loader)
+            samples["parse"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            texts = [
+                render_variant(
+                    job[0],
+                    job[1],
+                    job[2],
+                    *job[4:],
+                    fragment_loader=lambda p, loader=loader: load_yaml_cached(
+                        p, loader
+                    ),
+                ).to_yaml()
+                for job in jobs
+            ]
+            samples["render"].append(time.perf_counter() - start)
+        outputs[name] = texts
+        rows.append(
+            {
+                "loader": name,
+                "variants": len(jobs),
+                "fragments": len(frag_paths),
+                "parse_seconds": round(statistics.median(samples["parse"]), 4),
+                "render_seconds": round(statistics.median(samples["render"]), 4),
+            }
+        )
+    identical = len({tuple(texts) for texts in outputs.values()}) == 1
+    return rows, identical
+
+
+def print_loader_table(rows, identical):
+    print(f"{'loader':12s} {'parse(s)':>9s} {'render(s)':>10s} {'total(s)':>9s}")
+    for row in rows:
+        total = row["parse_seconds"] + row["render_seconds"]
+        print(
+            f"{row['loader']:12s} {row['parse_seconds']:9.3f}"
+            f" {row['render_seconds']:10.3f} {total:9.3f}"
+        )
+    print(
+        f"{rows[0]['variants']} variants from {rows[0]['fragments']} fragments;"
+        f" outputs {'identical' if identical else 'DIFFER'}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--scales",
+        default="100,500,1000",
+        help="Comma-separated numbers of base applications (default: 100,500,1000)",
+    )
+    parser.add_argument(
+        "--fragments", type=int, default=10, help="Feature fragments per scale"
+    )
+    parser.add_argument(
+        "--overrides", type=int, default=10, help="Overrides per base application"
+    )
+    parser.add_argument("--runs", type=int, default=1, help="Timed runs per scale")
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Skip the tracemalloc pass that measures peak memory",
+    )
+    parser.add_argument(
+        "--loaders",
+        action="store_true",
+        help="Compare the round-trip and fast fragment loaders on the real "
+        "--matrix workload instead of running the synthetic suite",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument(
+        "--compare",
+        default=None,
+        help="JSON output of a previous run; exit 1 if a phase got slower",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.5,
+        help="Allowed slowdown factor for --compare (default: 1.5)",
+    )
+    args = parser.parse_args()
+
+    try:
+        scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    except ValueError:
+        parser.error(f"invalid --scales: {args.scales}")
+    if not scales or min(scales) < 1 or args.runs < 1 or args.fragments < 1:
+        parser.error("--scales, --runs and --fragments must be positive")
+
+    if args.loaders:
+        rows, identical = bench_loaders(args.runs)
+        if args.json:
+            print(json.dumps({"loaders": rows, "identical": identical}, indent=2))
+        else:
+            print_loader_table(rows, identical)
+        sys.exit(0 if identical else 1)
+
+    rows = []
+    for scale in scales:
+        if not args.json:
+            print(f"Benchmarking scale {scale}...", file=sys.stderr)
+        rows.append(
+            bench_scale(
+                scale,
+                args.fragments,
+                args.overrides,
+                args.runs,
+                memory=not args.no_memory,
+            )
+        )
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_table(rows)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            regressions = compare(rows, json.load(fh), args.tolerance)
+        if regressions:
+            print("Slower than baseline:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
+        print(f"No phase slower than {args.tolerance}x baseline", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""Benchmark the supply-chain Quay bootstrap against a local Quay API stand-in.
+
+The stand-in emulates the parts of the Quay API used by
+charts/supply-chain/files/quay_user.py (health endpoints, CSRF, user,
+first-user initialize, sign-in, organization and robot endpoints) with
+configurable latency, slow start and error injection.  The benchmark runs the
+real provisioner against it and reports end-to-end time and request counts,
+so retry and provisioning changes can be checked without a cluster.
+
+Usage:
+  # Run every scenario once and print a table
+  python3 scripts/bench-quay-bootstrap.py
+
+  # Median of 5 runs per scenario, as JSON
+  python3 scripts/bench-quay-bootstrap.py --runs 5 --json
+
+  # Only selected scenarios
+  python3 scripts/bench-quay-bootstrap.py --scenarios fresh,converged
+
+  # Serve the stand-in for manual testing (Ctrl-C to stop)
+  python3 scripts/bench-quay-bootstrap.py --serve --port 8080 --slow-start 5
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import secrets
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(SCRIPT_DIR)
+DEFAULT_SCRIPT = os.path.join(
+    REPO_ROOT, "charts", "supply-chain", "files", "quay_user.py"
+)
+
+USERNAME = "quay-user"
+PASSWORD = "bench-password"
+EMAIL = "quay-user@example.com"
+
+ROUTES = [
+    ("health", re.compile(r"^/health/(instance|endtoend)$")),
+    ("csrf", re.compile(r"^/csrf_token$")),
+    ("initialize", re.compile(r"^/api/v1/user/initialize$")),
+    ("signin", re.compile(r"^/api/v1/signin$")),
+    ("current-user", re.compile(r"^/api/v1/user/$")),
+    ("user", re.compile(r"^/api/v1/users/(?P<user>[^/]+)$")),
+    ("organizations", re.compile(r"^/api/v1/organization/$")),
+    (
+        "robot",
+        re.compile(r"^/api/v1/organization/(?P<org>[^/]+)/robots/(?P<robot>[^/]+)$"),
+    ),
+    ("organization", re.compile(r"^/api/v1/organization/(?P<org>[^/]+)$")),
+]
+
+
+class QuayStandIn:
+    """In-memory Quay state plus the fault model applied to every request."""
+
+    def __init__(
+        self,
+        latency=0.0,
+        slow_start=0.0,
+        db_delay=0.0,
+        error_rate=0.0,
+        fail_first=0,
+        initialize=True,
+        seed=0,
+    ):
+        self.latency = latency
+        self.slow_start = slow_start
+        self.db_delay = db_delay
+        self.error_rate = error_rate
+        self.fail_first = fail_first
+        self.initialize = initialize
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.users = {}
+        self.orgs = {}
+        self.robots = {}
+        self.sessions = {}
+        self.tokens = {}
+        self.requests = Counter()
+        self.writes = 0
+        self.fail_first_left = fail_first
+
+    def restart(self):
+        """Restart the clock and counters but keep the provisioned state"""
+        with self.lock:
+            self.started = time.monotonic()
+            self.sessions.clear()
+            self.requests.clear()
+            self.fail_first_left = self.fail_first
+
+    def uptime(self):
+        return time.monotonic() - self.started
+
+    def inject_error(self):
+        with self.lock:
+            if self.fail_first_left > 0:
+                self.fail_first_left -= 1
+                return True
+            return self.random.random() < self.error_rate
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    quay = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def reply(self, status, body=None, cookie=None):
+        data = json.dumps(body if body is not None else {}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if cookie:
+            self.send_header("Set-Cookie", f"_csrf_session={cookie}; Path=/")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def session(self):
+        for part in self.headers.get("Cookie", "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == "_csrf_session" and value in self.quay.sessions:
+                return value
+        return None
+
+    def auth_user(self):
+        """Return the caller's username from a bearer token or signed-in session"""
+        auth = self.headers.get("Authorization", "")
+        if auth.startswith("Bearer "):
+            return self.quay.tokens.get(auth[len("Bearer ") :])
+        sid = self.session()
+        return self.quay.sessions[sid]["user"] if sid else None
+
+    def csrf_ok(self):
+        """Writes need a bearer token or the session's CSRF token"""
+        if self.headers.get("Authorization", "").startswith("Bearer "):
+            return True
+        sid = self.session()
+        return bool(sid) and self.headers.get("X-CSRF-Token") == (
+            self.quay.sessions[sid]["csrf"]
+        )
+
+    def dispatch(self, method):
+        quay = self.quay
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        payload = json.loads(raw) if raw else {}
+
+        route, match = "unknown", None
+        for name, pattern in ROUTES:
+            match = pattern.match(self.path)
+            if match:
+                route = name
+                break
+        with quay.lock:
+            quay.requests[f"{method} {route}"] += 1
+        if quay.latency:
+            time.sleep(quay.latency)
+
+        uptime = quay.uptime()
+        if uptime < quay.slow_start:
+            self.reply(503, {"status_code": 503, "message": "starting"})
+            return
+        if route == "health":
+            if self.path.endswith("endtoend"):
+                db = uptime >= quay.slow_start + quay.db_delay
+                services = {"database": db, "redis": True, "storage": True}
+                self.reply(200 if db else 503, {"data": {"services": services}})
+            else:
+                self.reply(200, {"data": {"services": {"registry_gunicorn": True}}})
+            return
+        if route != "csrf" and route != "unknown" and quay.inject_error():
+            self.reply(500, {"error_message": "injected failure"})
+            return
+        handler = getattr(self, f"{method.lower()}_{route.replace('-', '_')}", None)
+        if handler is None:
+            self.reply(405 if route != "unknown" else 404, {"message": "unsupported"})
+            return
+        with quay.lock:
+            handler(payload, **(match.groupdict() if match else {}))
+
+    def get_csrf(self, payload):
+        sid = self.session()
+        cookie = None
+        if not sid:
+            sid = cookie = secrets.token_hex(8)
+            self.quay.sessions[sid] = {"user": None}
+        self.quay.sessions[sid]["csrf"] = secrets.token_hex(8)
+        self.reply(200, {"csrf_token": self.quay.sessions[sid]["csrf"]}, cookie)
+
+    def post_initialize(self, payload):
+        if not self.quay.initialize:
+            self.reply(404, {"message": "not found"})
+        elif self.quay.users:
+            self.reply(
+                400, {"message": "Cannot initialize user in a non-empty database"}
+            )
+        else:
+            self.quay.writes += 1
+            self.quay.users[payload["username"]] = dict(payload)
+            token = secrets.token_hex(16)
+            self.quay.tokens[token] = payload["username"]
+            self.reply(200, {"access_token": token, "username": payload["username"]})
+
+    def post_current_user(self, payload):
+        if not self.csrf_ok():
+            self.reply(403, {"message": "CSRF token was invalid or missing."})
+        elif payload.get("username") in self.quay.users:
+            self.reply(400, {"error_message": "The username already exists"})
+        else:
+            self.quay.writes += 1
+            self.quay.users[payload["username"]] = dict(payload)
+            self.reply(200, {"awaiting_verification": False})
+
+    def get_user(self, payload, user):
+        if user in self.quay.users:
+            self.reply(200, {"username": user})
+        else:
+            self.reply(404, {"message": "Not Found"})
+
+    def post_signin(self, payload):
+        user = self.quay.users.get(payload.get("username"))
+        sid = self.session()
+        if not self.csrf_ok():
+            self.reply(403, {"message": "CSRF token was invalid or missing."})
+        elif not user or user["password"] != payload.get("password"):
+            self.reply(403, {"success": False, "message": "Invalid credentials"})
+        else:
+            self.quay.sessions[sid]["user"] = payload["username"]
+            self.reply(200, {"success": True})
+
+    def get_organization(self, payload, org):
+        if org not in self.quay.orgs:
+            self.reply(404, {"message": "Not Found"})
+        elif self.quay.orgs[org] != self.auth_user():
+            self.reply(403, {"message": "Unauthorized"})
+        else:
+            self.reply(200, {"name": org})
+
+    def post_organizations(self, payload):
+        user = self.auth_user()
+        if not user or not self.csrf_ok():
+            self.reply(403, {"message": "Unauthorized"})
+        elif payload["name"] in self.quay.orgs or payload["name"] in self.quay.users:
+            self.reply(400, {"error_message": "Name is already in use"})
+        else:
+            self.quay.writes += 1
+            self.quay.orgs[payload["name"]] = user
+            self.reply(201, {})
+
+    def get_robot(self, payload, org, robot):
+        if self.quay.orgs.get(org) != self.auth_user():
+            self.reply(403, {"message": "Unauthorized"})
+        elif (org, robot) not in self.quay.robots:
+            self.reply(404, {"message": "Could not find robot with specified username"})
+        else:
+            self.reply(
+                200, {"name": f"{org}+{robot}", **self.quay.robots[(org, robot)]}
+            )
+
+    def put_robot(self, payload, org, robot):
+        if self.quay.orgs.get(org) != self.auth_user() or not self.csrf_ok():
+            self.reply(403, {"message": "Unauthorized"})
+        elif (org, robot) in self.quay.robots:
+            self.reply(400, {"message": "Existing robot with name"})
+        else:
+            self.quay.writes += 1
+            self.quay.robots[(org, robot)] = dict(payload)
+            self.reply(201, {"name": f"{org}+{robot}"})
+
+
+def start_standin(quay, port=0):
+    """Serve quay on 127.0.0.1 in a background thread; return the server"""
+    handler = type("StandInHandler", (Handler,), {"quay": quay})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    quay.restart()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# name -> (stand-in options, provisioner environment, pre-provisioned state)
+SCENARIOS = {
+    "fresh": ({}, {}, False),
+    "converged": ({}, {}, True),
+    "slow-start": ({"slow_start": 3.0, "db_delay": 1.0}, {}, False),
+    "flaky": ({"fail_first": 2, "error_rate": 0.1}, {}, False),
+    "latency": ({"latency": 0.05}, {}, False),
+    "org-robots": (
+        {"latency": 0.02},
+        {"QUAY_ORGANIZATION": "ztvp", "QUAY_ROBOTS": "r1,r2,r3,r4,r5,r6"},
+        False,
+    ),
+    "org-robots-initialize": (
+        {"latency": 0.02},
+        {
+            "QUAY_ORGANIZATION": "ztvp",
+            "QUAY_ROBOTS": "r1,r2,r3,r4,r5,r6",
+            "QUAY_INITIALIZE": "true",
+        },
+        False,
+    ),
+}
+
+
+def run_bootstrap(script, port, env_overrides, poll_initial, timeout):
+    """Run the provisioner once; return (exit code, wall seconds, summary)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        report_file = os.path.join(tmp, "report.json")
+        env = dict(os.environ)
+        env.update(
+            {
+                "QUAY_HOST": f"127.0.0.1:{port}",
+                "QUAY_SCHEME": "http",
+                "QUAY_ADMIN_USER": USERNAME,
+                "QUAY_ADMIN_EMAIL": EMAIL,
+                "QUAY_ADMIN_PASSWORD": PASSWORD,
+                "QUAY_LOG_FORMAT": "json",
+                "QUAY_REPORT_FILE": report_file,
+                "QUAY_POLL_INITIAL": str(poll_initial),
+                "QUAY_WAIT_TIMEOUT": str(timeout),
+                "CA_CERT": os.path.join(tmp, "missing-ca.crt"),
+            }
+        )
+        env.update(env_overrides)
+        start = time.monotonic()
+        proc = subprocess.run(
+            [sys.executable, script], env=env, capture_output=True, text=True
+        )
+        wall = time.monotonic() - start
+        summary = {}
+        if os.path.isfile(report_file):
+            with open(report_file) as fh:
+                summary = json.load(fh)
+        return proc.returncode, wall, summary, proc.stdout + proc.stderr
+
+
+def median_of(values):
+    """Median of the values that are not None, or None if there are none"""
+    values = [v for v in values if v is not None]
+    return statistics.median_low(values) if values else None
+
+
+def bench_scenario(name, script, runs, poll_initial, timeout, verbose=False):
+    """Run a scenario runs times and return the median of every metric"""
+    options, env_overrides, converged = SCENARIOS[name]
+    walls, results, summaries, quays = [], [], [], []
+    for i in range(runs):
+        quay = QuayStandIn(seed=i, **options)
+        if converged:
+            # The user already exists, as on every scheduled re-run
+            quay.users[USERNAME] = {"email": EMAIL, "password": PASSWORD}
+        server = start_standin(quay)
+        try:
+            code, wall, summary, output = run_bootstrap(
+                script, server.server_address[1], env_overrides, poll_initial, timeout
+            )
+        finally:
+            server.shutdown()
+            server.server_close()
+        if verbose or code != 0:
+            print(output, file=sys.stderr)
+        walls.append(wall)
+        results.append(code == 0)
+        summaries.append(summary)
+        quays.append(quay)
+    endpoints = sorted({key for quay in quays for key in quay.requests})
+    return {
+        "scenario": name,
+        "runs": runs,
+        "ok": all(results),
+        "wall_seconds": round(statistics.median(walls), 3),
+        "wall_seconds_min": round(min(walls), 3),
+        "time_to_ready": median_of(s.get("time_to_ready") for s in summaries),
+        "requests": median_of(sum(quay.requests.values()) for quay in quays),
+        "attempts": median_of(s.get("attempts") for s in summaries),
+        "writes": median_of(quay.writes for quay in quays),
+        "request_counts": {
+            key: median_of(quay.requests[key] for quay in quays) for key in endpoints
+        },
+    }
+
+
+def print_table(rows):
+    print(
+        f"{'scenario':24s} {'ok':>3s} {'wall(s)':>8s} {'ready(s)':>9s}"
+        f" {'requests':>8s} {'attempts':>8s} {'writes':>6s}"
+    )
+    for row in rows:
+        ready = row["time_to_ready"]
+        print(
+            f"{row['scenario']:24s} {'yes' if row['ok'] else 'NO':>3s}"
+            f" {row['wall_seconds']:8.3f}"
+            f" {ready if ready is not None else '-':>9}"
+            f" {row['requests']:8d} {row['attempts'] or '-':>8}"
+            f" {row['writes']:6d}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"Comma-separated scenarios (default: all of {', '.join(SCENARIOS)})",
+    )
+    parser.add_argument("--runs", type=int, default=1, help="Runs per scenario")
+    parser.add_argument(
+        "--script", default=DEFAULT_SCRIPT, help="Provisioner script to benchmark"
+    )
+    parser.add_argument(
+        "--poll-initial",
+        type=float,
+        default=0.5,
+        help="QUAY_POLL_INITIAL passed to the provisioner (default: 0.5)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=60,
+        help="QUAY_WAIT_TIMEOUT passed to the provisioner (default: 60)",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument(
+        "--verbose", action="store_true", help="Show the provisioner output"
+    )
+    parser.add_argument(
+        "--serve", action="store_true", help="Only serve the stand-in and block"
+    )
+    parser.add_argument("--port", type=int, default=8080, help="Port for --serve")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds per request"
+    )
+    parser.add_argument(
+        "--slow-start", type=float, default=0.0, help="Seconds answering 503"
+    )
+    parser.add_argument(
+        "--db-delay",
+        type=float,
+        default=0.0,
+        help="Extra seconds the database stays down after slow start",
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fraction of API calls failing"
+    )
+    parser.add_argument(
+        "--fail-first", type=int, default=0, help="Fail the first N API calls"
+    )
+    parser.add_argument(
+        "--no-initialize",
+        action="store_true",
+        help="Answer 404 on /api/v1/user/initialize (feature disabled)",
+    )
+    args = parser.parse_args()
+
+    if args.serve:
+        quay = QuayStandIn(
+            latency=args.latency,
+            slow_start=args.slow_start,
+            db_delay=args.db_delay,
+            error_rate=args.error_rate,
+            fail_first=args.fail_first,
+            initialize=not args.no_initialize,
+        )
+        server = start_standin(quay, args.port)
+        print(f"Quay stand-in listening on http://127.0.0.1:{args.port}")
+        print(f"  QUAY_HOST=127.0.0.1:{args.port} QUAY_SCHEME=http")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+            print(json.dumps(dict(quay.requests), indent=2))
+        return
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    if not os.path.isfile(args.script):
+        print(f"ERROR: provisioner script not found: {args.script}", file=sys.stderr)
+        sys.exit(1)
+
+    rows = [
+        bench_scenario(
+            name, args.script, args.runs, args.poll_initial, args.timeout, args.verbose
+        )
+        for name in names
+    ]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_table(rows)
+    sys.exit(0 if all(row["ok"] for row in rows) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Compose values-hub.yaml variants from declarative feature fragments.
+
+Library behind scripts/gen-feature-variants.py.  With scripts/ on sys.path:
+
+    from feature_variants import build_variant
+
+    variant = build_variant(["supply-chain"], registry_option=1)
+    variant.data        # merged ruamel.yaml tree
+    variant.to_yaml()   # the text the CLI would write
+
+Errors are raised as FeatureVariantError subclasses instead of exiting.
+"""
+
+from .archive import (
+    ARCHIVE_FORMATS,
+    archive_format,
+    archive_variants,
+    read_stream,
+    render_job_files,
+    stream_variants,
+)
+from .chartcheck import (
+    ChartIndex,
+    check_charts,
+    check_variant,
+    check_variants,
+    load_chart_index,
+    split_value_path,
+)
+from .diff import diff_trees, diff_variant, diff_variants
+from .errors import (
+    CircularDependencyError,
+    FeatureConflictError,
+    FeatureVariantError,
+    InputFileNotFoundError,
+    InvalidGitRepoError,
+    MissingGitRepoError,
+    RegistryOptionError,
+    UnknownFeatureError,
+)
+from .graph import FeatureGraph
+from .incremental import (
+    MANIFEST_NAME,
+    generate_incremental,
+    load_manifest,
+    save_manifest,
+    variant_input_hash,
+)
+from .matrix import (
+    VariantIndex,
+    generate_matrix,
+    job_inputs,
+    plan_matrix,
+    plan_variants,
+)
+from .merge import FragmentMerger, merge_fragment
+from .profiling import Profiler, phase, profiling
+from .registry import (
+    FEATURES_DIR,
+    REGISTRY_LABELS,
+    REPO_ROOT,
+    enumerate_feature_sets,
+    load_feature_graph,
+    load_feature_registry,
+    registry_fragment_path,
+    repository_names,
+    resolve_dependencies,
+)
+from .variant import (
+    VAULT_JWT_OVERRIDE_FILE,
+    Variant,
+    build_matrix_output_name,
+    build_output_name,
+    build_variant,
+    generate_variant,
+    render_variant,
+    render_vault_jwt_overrides,
+    update_vault_jwt_override_file,
+    validate_output,
+    vault_jwt_output_path,
+)
+from .watch import FileWatcher, watch_variants
+from .yamlio import (
+    dump_yaml,
+    load_fragment_cached,
+    load_fragment_file,
+    load_yaml_cached,
+    load_yaml_file,
+)
+
+__all__ = [
+    "ARCHIVE_FORMATS",
+    "FEATURES_DIR",
+    "MANIFEST_NAME",
+    "REGISTRY_LABELS",
+    "REPO_ROOT",
+    "VAULT_JWT_OVERRIDE_FILE",
+    "ChartIndex",
+    "CircularDependencyError",
+    "FeatureConflictError",
+    "FeatureGraph",
+    "FeatureVariantError",
+    "FileWatcher",
+    "FragmentMerger",
+    "InputFileNotFoundError",
+    "InvalidGitRepoError",
+    "MissingGitRepoError",
+    "Profiler",
+    "RegistryOptionError",
+    "UnknownFeatureError",
+    "Variant",
+    "VariantIndex",
+    "archive_format",
+    "archive_variants",
+    "build_matrix_output_name",
+    "build_output_name",
+    "build_variant",
+    "check_charts",
+    "check_variant",
+    "check_variants",
+    "diff_trees",
+    "diff_variant",
+    "diff_variants",
+    "dump_yaml",
+    "enumerate_feature_sets",
+    "generate_incremental",
+    "generate_matrix",
+    "generate_variant",
+    "load_feature_graph",
+    "load_feature_registry",
+    "load_fragment_cached",
+    "load_fragment_file",
+    "job_inputs",
+    "load_chart_index",
+    "load_manifest",
+    "load_yaml_cached",
+    "load_yaml_file",
+    "merge_fragment",
+    "plan_matrix",
+    "phase",
+    "plan_variants",
+    "profiling",
+    "read_stream",
+    "registry_fragment_path",
+    "render_job_files",
+    "render_variant",
+    "render_vault_jwt_overrides",
+    "repository_names",
+    "resolve_dependencies",
+    "save_manifest",
+    "split_value_path",
+    "stream_variants",
+    "update_vault_jwt_override_file",
+    "validate_output",
+    "variant_input_hash",
+    "vault_jwt_output_path",
+    "watch_variants",
+]
@@ -0,0 +1,188 @@
+"""Bundle generated variants into one archive or stdout stream (--archive, --stream).
+
+Every generated file becomes one member, followed by a manifest named
+MANIFEST_NAME in the --incremental format ({name: {"inputs", "output"}}), so
+an extracted archive can be used as an --incremental output directory.
+
+The stream format is a sequence of records, each a header line
+"<size> <name>\\n" followed by exactly <size> bytes; read_stream parses it.
+"""
+
+import hashlib
+import io
+import json
+import os
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from .incremental import MANIFEST_NAME, variant_input_hash
+from .matrix import _preload_inputs
+from .profiling import phase
+from .registry import FEATURES_DIR
+from .variant import render_variant, render_vault_jwt_overrides, vault_jwt_output_path
+from .yamlio import dump_yaml
+
+# archive name suffix -> (kind, mode)
+ARCHIVE_FORMATS = {
+    ".tar": ("tar", "w"),
+    ".tar.gz": ("tar", "w:gz"),
+    ".tgz": ("tar", "w:gz"),
+    ".tar.xz": ("tar", "w:xz"),
+    ".zip": ("zip", zipfile.ZIP_DEFLATED),
+}
+
+
+def archive_format(path):
+    """Return (kind, mode) for an archive path, or None for an unknown suffix."""
+    for suffix, fmt in ARCHIVE_FORMATS.items():
+        if path.endswith(suffix):
+            return fmt
+    return None
+
+
+def render_job_files(job, features_dir=FEATURES_DIR):
+    """Render one generation job in memory.
+
+    Returns (input hash, [(file name, bytes)]) with the variant and, when it
+    collects vault JWT roles, its vault JWT override file.  The names are the
+    ones the job would write in its output directory.
+    """
+    base, resolved, reg_path, out_path, org, image_name, git_repo = job
+    variant = render_variant(
+        base,
+        resolved,
+        reg_path,
+        org,
+        image_name,
+        git_repo,
+        features_dir=features_dir,
+    )
+    files = [(os.path.basename(out_path), variant.to_yaml().encode())]
+    if variant.vault_jwt_roles:
+        with phase("dump", "vault-jwt"):
+            jwt_data = dump_yaml(render_vault_jwt_overrides(variant.vault_jwt_roles))
+        files.append(
+            (
+                os.path.basename(vault_jwt_output_path(out_path)),
+                jwt_data.encode(),
+            )
+        )
+    input_hash = variant_input_hash(base, resolved, reg_path, org, image_name, git_repo)
+    return input_hash, files
+
+
+class _TarWriter:
+    def __init__(self, fh, mode):
+        self.tar = tarfile.open(fileobj=fh, mode=mode)
+        self.mtime = int(time.time())
+
+    def add(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = self.mtime
+        info.mode = 0o644
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.tar.close()
+
+
+class _ZipWriter:
+    def __init__(self, fh, compression):
+        self.zip = zipfile.ZipFile(fh, "w", compression)
+        self.date_time = time.localtime()[:6]
+
+    def add(self, name, data):
+        info = zipfile.ZipInfo(name, self.date_time)
+        info.compress_type = self.zip.compression
+        info.external_attr = 0o644 << 16
+        self.zip.writestr(info, data)
+
+    def close(self):
+        self.zip.close()
+
+
+class _StreamWriter:
+    def __init__(self, fh):
+        self.fh = fh
+
+    def add(self, name, data):
+        self.fh.write(f"{len(data)} {name}\n".encode())
+        self.fh.write(data)
+
+    def close(self):
+        self.fh.flush()
+
+
+def _write_bundle(work, writer, jobs):
+    """Render every job into writer in plan order and add the manifest."""
+    if jobs > 1 and len(work) > 1:
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_preload_inputs,
+            initargs=(work[0][0], {}),
+        ) as pool:
+            results = pool.map(render_job_files, work, chunksize=4)
+            manifest = _add_results(results, writer)
+    else:
+        manifest = _add_results(map(render_job_files, work), writer)
+    data = json.dumps(manifest, indent=2, sort_keys=True).encode()
+    writer.add(MANIFEST_NAME, data)
+    writer.close()
+    return manifest
+
+
+def _add_results(results, writer):
+    manifest = {}
+    for input_hash, files in results:
+        for name, data in files:
+            writer.add(name, data)
+            manifest[name] = {
+                "inputs": input_hash,
+                "output": hashlib.sha256(data).hexdigest(),
+            }
+    return manifest
+
+
+def archive_variants(work, path, jobs=1):
+    """Render every job into one tar or zip archive at path.
+
+    The format follows the suffix (see ARCHIVE_FORMATS).  The archive is
+    written to a temporary file and renamed, so readers never see a partial
+    archive.  Uses a process pool when jobs > 1.  Returns the manifest.
+    """
+    kind, mode = archive_format(path)
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "wb") as fh:
+            writer = _TarWriter(fh, mode) if kind == "tar" else _ZipWriter(fh, mode)
+            manifest = _write_bundle(work, writer, jobs)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return manifest
+
+
+def stream_variants(work, fh, jobs=1):
+    """Write every job's files to the binary file fh as length-prefixed records.
+
+    Returns the manifest, which is also the last record.
+    """
+    return _write_bundle(work, _StreamWriter(fh), jobs)
+
+
+def read_stream(fh):
+    """Yield (name, bytes) for each record written by stream_variants."""
+    while True:
+        header = fh.readline()
+        if not header:
+            return
+        size, name = header.decode().rstrip("\n").split(" ", 1)
+        data = fh.read(int(size))
+        if len(data) != int(size):
+            raise EOFError(f"truncated record '{name}'")
+        yield name, data
@@ -0,0 +1,251 @@
+"""Check variants against the values of the charts they deploy (--check-charts)."""
+
+import functools
+import glob
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from ruamel.yaml import YAML
+
+from .registry import FEATURES_DIR, REPO_ROOT
+from .variant import render_variant
+
+logger = logging.getLogger(__name__)
+
+# Path component standing for any item of a list ("a[0].b" -> a, [], b).
+LIST_ITEM = "[]"
+
+# Top-level keys every application receives from the pattern framework.
+PATTERN_KEYS = frozenset({"global", "clusterGroup"})
+
+# extraValueFiles under this directory are per-application overrides; the
+# pattern-wide values-*.yaml files at the repository root are not.
+OVERRIDES_DIR = "overrides"
+
+VALUES_REF_RE = re.compile(r"\$?\.Values((?:\.[A-Za-z_]\w*)+)")
+# Values rendered or iterated as a whole accept keys the chart does not list.
+OPEN_REF_RE = re.compile(
+    r"(?:toYaml|range\s+[^}]*?:=)\s+\$?\.Values((?:\.[A-Za-z_]\w*)+)"
+)
+
+
+def split_value_path(name):
+    """Split a helm --set style name into a tuple of key path components.
+
+    "a.b" -> ("a", "b"); "a\\.b" -> ("a.b",); "a[0].b" -> ("a", "[]", "b").
+    """
+    parts = []
+    buf = []
+    i = 0
+    while i < len(name):
+        c = name[i]
+        if c == "\\" and i + 1 < len(name):
+            buf.append(name[i + 1])
+            i += 2
+            continue
+        end = name.find("]", i) if c == "[" else -1
+        if c == ".":
+            parts.append("".join(buf))
+            buf = []
+        elif end > i:
+            parts.extend(("".join(buf), LIST_ITEM))
+            buf = []
+            i = end
+        else:
+            buf.append(c)
+        i += 1
+    parts.append("".join(buf))
+    return tuple(p for p in parts if p)
+
+
+def _load_values(path):
+    with open(path) as fh:
+        return YAML(typ="safe").load(fh)
+
+
+class ChartIndex:
+    """Key paths a local chart accepts.
+
+    Built from the chart's values.yaml and the .Values references in its
+    templates.  Keys below an empty mapping, an empty list, a null value, a
+    value a template renders with toYaml or iterates with range, a
+    dependency (subchart) or a pattern-provided top-level key are not known
+    in advance and are always accepted.
+    """
+
+    def __init__(self, chart_dir):
+        self.chart_dir = chart_dir
+        self.paths = set()
+        self.open_paths = set()
+        self.open_roots = set(PATTERN_KEYS)
+
+        values_path = os.path.join(chart_dir, "values.yaml")
+        if os.path.isfile(values_path):
+            self._index_values(_load_values(values_path) or {}, ())
+
+        chart = _load_values(os.path.join(chart_dir, "Chart.yaml")) or {}
+        for dep in chart.get("dependencies") or []:
+            self.open_roots.add(dep.get("alias") or dep.get("name"))
+
+        templates = os.path.join(chart_dir, "templates", "**", "*")
+        for template in glob.glob(templates, recursive=True):
+            if not os.path.isfile(template):
+                continue
+            with open(template, errors="replace") as fh:
+                text = fh.read()
+            for match in VALUES_REF_RE.finditer(text):
+                parts = tuple(match.group(1)[1:].split("."))
+                self.paths.update(parts[:i] for i in range(1, len(parts) + 1))
+            for match in OPEN_REF_RE.finditer(text):
+                self.open_paths.add(tuple(match.group(1)[1:].split(".")))
+
+    def _index_values(self, node, prefix):
+        if isinstance(node, dict):
+            if not node and prefix:
+                self.open_paths.add(prefix)
+            for key, value in node.items():
+                path = prefix + (str(key),)
+                self.paths.add(path)
+                self._index_values(value, path)
+        elif isinstance(node, list):
+            item = prefix + (LIST_ITEM,)
+            self.paths.add(item)
+            if not node:
+                self.open_paths.add(item)
+            for value in node:
+                self._index_values(value, item)
+        elif node is None and prefix:
+            self.open_paths.add(prefix)
+
+    def accepts(self, parts):
+        """True when the chart can take a value at the key path parts."""
+        if not parts or parts[0] in self.open_roots or parts in self.paths:
+            return True
+        return any(parts[:i] in self.open_paths for i in range(1, len(parts)))
+
+    def unknown_keys(self, values, prefix=()):
+        """Yield the key paths of a values mapping the chart does not accept.
+
+        Mappings are descended into (helm merges them); a rejected key is
+        reported once, without its children.
+        """
+        for key, value in values.items():
+            path = prefix + (str(key),)
+            if not self.accepts(path):
+                yield path
+            elif isinstance(value, dict):
+                yield from self.unknown_keys(value, path)
+
+
+@functools.lru_cache(maxsize=None)
+def load_chart_index(chart_dir):
+    """Return the ChartIndex for chart_dir, built once per process."""
+    return ChartIndex(chart_dir)
+
+
+@functools.lru_cache(maxsize=None)
+def _unknown_override_keys(chart_dir, file_path):
+    values = _load_values(file_path)
+    if not isinstance(values, dict):
+        return ()
+    return tuple(load_chart_index(chart_dir).unknown_keys(values))
+
+
+def check_charts(data, repo_root=REPO_ROOT):
+    """Check the applications of a merged tree against the local charts.
+
+    For each application deployed from a path in this repository, the path
+    must be a chart, every overrides[].name must be a key the chart accepts,
+    and each extraValueFiles entry must exist; those under overrides/ must
+    only set accepted keys.  Applications deployed from a chart repository
+    are only checked for missing value files.  Returns the list of problems.
+    """
+    problems = []
+    apps = data.get("clusterGroup", {}).get("applications") or {}
+    for app_name, app in apps.items():
+        if not isinstance(app, dict):
+            continue
+        index = chart_dir = None
+        chart_path = app.get("path")
+        if chart_path is not None:
+            chart_dir = os.path.normpath(os.path.join(repo_root, chart_path))
+            if os.path.isfile(os.path.join(chart_dir, "Chart.yaml")):
+                index = load_chart_index(chart_dir)
+            else:
+                problems.append(
+                    f"application '{app_name}': path '{chart_path}' is not a "
+                    f"chart in this repository"
+                )
+
+        for ovr in app.get("overrides") or []:
+            name = ovr.get("name") if isinstance(ovr, dict) else None
+            if name and index is not None:
+                if not index.accepts(split_value_path(name)):
+                    problems.append(
+                        f"application '{app_name}': override '{name}' is not a "
+                        f"key of {chart_path}/values.yaml"
+                    )
+
+        for value_file in app.get("extraValueFiles") or []:
+            if "{{" in value_file:
+                continue
+            rel_path = value_file.lstrip("/")
+            file_path = os.path.join(repo_root, rel_path)
+            if not os.path.isfile(file_path):
+                problems.append(
+                    f"application '{app_name}': extraValueFiles entry "
+                    f"'{value_file}' does not exist"
+                )
+            elif index is not None and rel_path.startswith(OVERRIDES_DIR + "/"):
+                for path in _unknown_override_keys(chart_dir, file_path):
+                    problems.append(
+                        f"application '{app_name}': '{'.'.join(path)}' in "
+                        f"{value_file} is not a key of {chart_path}/values.yaml"
+                    )
+    return problems
+
+
+def check_variant(job, features_dir=FEATURES_DIR):
+    """Render one generation job in memory and check it.
+
+    Returns (output path, problems), where problems include the validate_output
+    messages.  Nothing is written.
+    """
+    base, resolved, reg_path, out_path, org, image_name, git_repo = job
+    variant = render_variant(
+        base,
+        resolved,
+        reg_path,
+        org,
+        image_name,
+        git_repo,
+        features_dir=features_dir,
+    )
+    return out_path, variant.warnings + check_charts(variant.data)
+
+
+def check_variants(work, jobs=1):
+    """Check every job and log the result.
+
+    Uses a process pool when jobs > 1.  Returns the number of variants with
+    problems.
+    """
+    if jobs > 1 and len(work) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(check_variant, work, chunksize=4))
+    else:
+        results = [check_variant(job) for job in work]
+
+    failing = 0
+    for path, problems in results:
+        if problems:
+            failing += 1
+            logger.info(f"  !! {path} ({len(problems)} problems)")
+            for problem in problems:
+                logger.info(f"       {problem}")
+        else:
+            logger.info(f"  ok {path}")
+    logger.info(f"{failing} of {len(results)} variants have problems")
+    return failing
@@ -0,0 +1,159 @@
+"""Structural comparison of rendered variants with existing output files (--diff)."""
+
+import json
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from ruamel.yaml import YAML
+
+from .merge import _is_named_list
+from .registry import FEATURES_DIR
+from .variant import render_variant, render_vault_jwt_overrides, vault_jwt_output_path
+
+logger = logging.getLogger(__name__)
+
+ADDED = "+"
+REMOVED = "-"
+CHANGED = "~"
+
+PLAIN_KEY_RE = re.compile(r"^[\w-]+$")
+
+
+def _join(path, key):
+    key = str(key)
+    if PLAIN_KEY_RE.match(key):
+        return f"{path}.{key}" if path else key
+    return f"{path}[{json.dumps(key)}]"
+
+
+def _named_lists(old, new):
+    """True when both lists are keyed by name (an empty list counts as named)."""
+    return bool(old or new) and all(
+        not lst or _is_named_list(lst) for lst in (old, new)
+    )
+
+
+def diff_trees(old, new, path=""):
+    """Yield (kind, path, old value, new value) for each difference.
+
+    Mappings are compared by key regardless of order.  Lists of mappings that
+    all have a 'name' (overrides, roles, ...) are compared by name, so
+    reordering is not a change and entries are reported as list[name=...];
+    other lists are compared by position.  Comments and quoting are ignored.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                yield REMOVED, _join(path, key), old[key], None
+        for key in new:
+            if key not in old:
+                yield ADDED, _join(path, key), None, new[key]
+            else:
+                yield from diff_trees(old[key], new[key], _join(path, key))
+    elif isinstance(old, list) and isinstance(new, list):
+        if _named_lists(old, new):
+            old_items = {item["name"]: item for item in old}
+            new_items = {item["name"]: item for item in new}
+            for name, item in old_items.items():
+                if name not in new_items:
+                    yield REMOVED, f"{path}[name={name}]", item, None
+            for name, item in new_items.items():
+                item_path = f"{path}[name={name}]"
+                if name not in old_items:
+                    yield ADDED, item_path, None, item
+                else:
+                    yield from diff_trees(old_items[name], item, item_path)
+        else:
+            common = min(len(old), len(new))
+            for i in range(common):
+                yield from diff_trees(old[i], new[i], f"{path}[{i}]")
+            for i in range(common, len(old)):
+                yield REMOVED, f"{path}[{i}]", old[i], None
+            for i in range(common, len(new)):
+                yield ADDED, f"{path}[{i}]", None, new[i]
+    elif old != new or isinstance(old, bool) != isinstance(new, bool):
+        yield CHANGED, path, old, new
+
+
+def _short(value, limit=72):
+    text = json.dumps(value, default=str)
+    return text if len(text) <= limit else f"{text[:limit - 3]}..."
+
+
+def format_change(change):
+    kind, path, old, new = change
+    if kind == ADDED:
+        return f"{kind} {path}: {_short(new)}"
+    if kind == REMOVED:
+        return f"{kind} {path}"
+    return f"{kind} {path}: {_short(old)} -> {_short(new)}"
+
+
+def diff_file(path, tree):
+    """Return the changes from the YAML file at path to tree.
+
+    Returns None when path does not exist.  The file is read with the safe
+    loader: comments and quoting do not take part in the comparison.
+    """
+    if not os.path.isfile(path):
+        return None
+    with open(path) as fh:
+        old = YAML(typ="safe", pure=True).load(fh)
+    return list(diff_trees(old, tree))
+
+
+def diff_variant(job, features_dir=FEATURES_DIR):
+    """Render one generation job in memory and diff it with its output files.
+
+    Returns [(path, changes)] for the variant and, when it collects vault JWT
+    roles, its vault JWT override file.  changes is None for a missing file.
+    Nothing is written.
+    """
+    base, resolved, reg_path, out_path, org, image_name, git_repo = job
+    variant = render_variant(
+        base,
+        resolved,
+        reg_path,
+        org,
+        image_name,
+        git_repo,
+        features_dir=features_dir,
+    )
+    results = [(out_path, diff_file(out_path, variant.data))]
+    if variant.vault_jwt_roles:
+        jwt_path = vault_jwt_output_path(out_path)
+        jwt_data = render_vault_jwt_overrides(variant.vault_jwt_roles)
+        results.append((jwt_path, diff_file(jwt_path, jwt_data)))
+    return results
+
+
+def diff_variants(work, jobs=1):
+    """Diff every job against its existing output files and log the result.
+
+    Uses a process pool when jobs > 1.  Returns the number of files that
+    differ or are missing.
+    """
+    if jobs > 1 and len(work) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(diff_variant, work, chunksize=4))
+    else:
+        results = [diff_variant(job) for job in work]
+
+    differing = 0
+    total = 0
+    for path, changes in (r for result in results for r in result):
+        total += 1
+        if changes is None:
+            differing += 1
+            logger.info(f"  !! {path} (no existing file)")
+        elif changes:
+            differing += 1
+            logger.info(f"  ~~ {path} ({len(changes)} changes)")
+            for change in changes:
+                logger.info(f"       {format_change(change)}")
+        else:
+            logger.info(f"  == {path} (no changes)")
+    logger.info(f"{differing} of {total} files differ")
+    return differing
@@ -0,0 +1,33 @@
+"""Exceptions raised by the feature variant generator."""
+
+
+class FeatureVariantError(Exception):
+    """Base class for all generator errors."""
+
+
+class UnknownFeatureError(FeatureVariantError):
+    """A requested or depended-on feature is not in features.yaml."""
+
+
+class CircularDependencyError(FeatureVariantError):
+    """The depends_on graph of features.yaml contains a cycle."""
+
+
+class RegistryOptionError(FeatureVariantError):
+    """A registry option is missing, unknown or not allowed."""
+
+
+class MissingGitRepoError(FeatureVariantError):
+    """A feature that needs a Git repository URL was requested without one."""
+
+
+class InvalidGitRepoError(FeatureVariantError):
+    """A Git repository URL has no hostname."""
+
+
+class InputFileNotFoundError(FeatureVariantError):
+    """The base file or a fragment file does not exist."""
+
+
+class FeatureConflictError(FeatureVariantError):
+    """Mutually exclusive features (conflicts_with) were combined."""
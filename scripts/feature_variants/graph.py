@@ -0,0 +1,176 @@
+"""Feature dependency graph, analysed once per registry."""
+
+import itertools
+
+from .errors import (
+    CircularDependencyError,
+    FeatureConflictError,
+    RegistryOptionError,
+    UnknownFeatureError,
+)
+
+
+class FeatureGraph:
+    """The depends_on / conflicts_with graph of features.yaml.
+
+    Each feature's transitive closure and merge order are computed when the
+    graph is built.  Resolving a request then only concatenates precomputed
+    orders, and conflict checks are set lookups.  Unknown references, cycles
+    and features that depend on conflicting features are all reported when
+    the graph is built, not only the first one a request runs into.
+    """
+
+    def __init__(self, feature_defs, registry_opts=None):
+        self.feature_defs = feature_defs
+        self.registry_opts = registry_opts or {}
+
+        problems = [
+            f"feature '{name}' {key.replace('_', ' ')} unknown feature '{ref}'"
+            for name, info in feature_defs.items()
+            for key in ("depends_on", "conflicts_with")
+            for ref in info.get(key) or []
+            if ref not in feature_defs
+        ]
+        if problems:
+            raise UnknownFeatureError("; ".join(problems))
+
+        # name -> features it needs, dependencies first (depth-first post-order)
+        self.orders = {}
+        cycles = {}
+        for name in feature_defs:
+            try:
+                self._order(name, [])
+            except CircularDependencyError as e:
+                cycles.setdefault(frozenset(e.cycle), str(e))
+        if cycles:
+            raise CircularDependencyError("; ".join(cycles.values()))
+
+        self.closures = {name: frozenset(o) for name, o in self.orders.items()}
+        # name -> features whose closure includes it
+        self.dependents = {name: set() for name in feature_defs}
+        for name, closure in self.closures.items():
+            for dep in closure:
+                self.dependents[dep].add(name)
+        self.dependents = {n: frozenset(d) for n, d in self.dependents.items()}
+
+        self.conflicts = {name: set() for name in feature_defs}
+        for name, info in feature_defs.items():
+            for other in info.get("conflicts_with") or []:
+                self.conflicts[name].add(other)
+                self.conflicts[other].add(name)
+        self.conflicts = {n: frozenset(c) for n, c in self.conflicts.items()}
+
+        self.order = self.expand(feature_defs)
+        self.position = {name: i for i, name in enumerate(self.order)}
+
+        problems = [
+            f"feature '{name}' depends on mutually exclusive features "
+            f"'{a}' and '{b}'"
+            for name in self.order
+            for a, b in self.conflicts_in(self.closures[name])
+        ]
+        if problems:
+            raise FeatureConflictError("; ".join(problems))
+
+    def _order(self, name, stack):
+        if name in self.orders:
+            return self.orders[name]
+        if name in stack:
+            cycle = stack[stack.index(name) :] + [name]
+            error = CircularDependencyError(
+                f"circular dependency: {' -> '.join(cycle)}"
+            )
+            error.cycle = cycle
+            raise error
+        stack.append(name)
+        order = dict.fromkeys(
+            f
+            for dep in self.feature_defs[name].get("depends_on") or []
+            for f in self._order(dep, stack)
+        )
+        order[name] = None
+        stack.pop()
+        self.orders[name] = tuple(order)
+        return self.orders[name]
+
+    def expand(self, requested):
+        """Return requested plus its transitive dependencies, dependencies first.
+
+        The order is the one a depth-first walk of requested would produce;
+        it is the order fragments are merged in.
+        """
+        unknown = [f for f in requested if f not in self.orders]
+        if unknown:
+            raise UnknownFeatureError(
+                ", ".join(f"unknown feature '{f}'" for f in unknown)
+            )
+        return list(dict.fromkeys(itertools.chain(*map(self.orders.get, requested))))
+
+    def conflicts_in(self, features):
+        """Return the mutually exclusive (a, b) pairs among features."""
+        present = set(features)
+        return sorted(
+            (a, b)
+            for a in present
+            for b in self.conflicts[a] & present
+            if self.position[a] < self.position[b]
+        )
+
+    def resolve(self, requested):
+        """expand() requested, raising FeatureConflictError on conflicts."""
+        resolved = self.expand(requested)
+        pairs = self.conflicts_in(resolved)
+        if pairs:
+            raise FeatureConflictError(
+                "; ".join(
+                    f"features '{a}' and '{b}' are mutually exclusive" for a, b in pairs
+                )
+            )
+        return resolved
+
+    def feature_sets(self):
+        """Return every distinct dependency-closed, conflict-free feature set.
+
+        Each entry is (maximal, resolved) where maximal lists the features not
+        already implied by another member (in registry order) and resolved is
+        the closure in merge order.
+        """
+        names = list(self.feature_defs)
+        seen = {}
+        for mask in range(1, 1 << len(names)):
+            closure = frozenset().union(
+                *(self.closures[names[i]] for i in range(len(names)) if mask >> i & 1)
+            )
+            if closure in seen or any(self.conflicts[f] & closure for f in closure):
+                continue
+            maximal = [
+                f
+                for f in names
+                if f in closure
+                and not any(f in self.closures[g] for g in closure - {f})
+            ]
+            seen[closure] = (maximal, self.expand(maximal))
+        return list(seen.values())
+
+    def registry_options(self, value):
+        """Return the registry option numbers selected by a --registry-option value.
+
+        'all' selects every option.  Otherwise exactly one option may be
+        given: a variant is built with a single registry.
+        """
+        if value == "all":
+            return sorted(self.registry_opts)
+        try:
+            option = int(value)
+        except (TypeError, ValueError):
+            choices = ", ".join(str(o) for o in sorted(self.registry_opts))
+            reason = (
+                "registry options are mutually exclusive; " if "," in str(value) else ""
+            )
+            raise RegistryOptionError(
+                f"invalid registry option '{value}' ({reason}use one of {choices} "
+                f"or 'all')"
+            ) from None
+        if option not in self.registry_opts:
+            raise RegistryOptionError(f"no registry option {option} in features.yaml")
+        return [option]
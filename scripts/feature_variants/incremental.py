@@ -0,0 +1,153 @@
+"""Content-hash manifest used by --incremental to skip unchanged variants."""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+
+from .registry import FEATURES_DIR
+from .variant import VAULT_JWT_OVERRIDE_FILE, generate_variant, vault_jwt_output_path
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".gen-feature-variants-manifest.json"
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _file_digest(path):
+    with open(path, "rb") as fh:
+        return hashlib.sha256(fh.read()).hexdigest()
+
+
+def variant_input_hash(base_path, resolved_features, registry_fragment_path, *settings):
+    """Hash everything a variant is generated from.
+
+    Covers the generator's own sources, the base, every fragment in merge
+    order, the registry fragment, the vault JWT override file the per-variant
+    override file is derived from and the remaining CLI-derived settings (org,
+    image name, git repository).
+    """
+    h = hashlib.sha256()
+    paths = sorted(glob.glob(os.path.join(PACKAGE_DIR, "*.py")))
+    paths.append(base_path)
+    paths += [os.path.join(FEATURES_DIR, f"{f}.yaml") for f in resolved_features]
+    if registry_fragment_path:
+        paths.append(registry_fragment_path)
+    if os.path.isfile(VAULT_JWT_OVERRIDE_FILE):
+        paths.append(VAULT_JWT_OVERRIDE_FILE)
+    for path in paths:
+        h.update(os.path.basename(path).encode())
+        h.update(_file_digest(path).encode())
+    h.update(json.dumps(settings).encode())
+    return h.hexdigest()
+
+
+def load_manifest(outdir):
+    """Return {output name: {"inputs": hash, "output": hash}} for outdir."""
+    path = os.path.join(outdir, MANIFEST_NAME)
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except ValueError:
+        logger.warning("ignoring corrupt manifest %s", path)
+        return {}
+
+
+def save_manifest(outdir, manifest):
+    path = os.path.join(outdir, MANIFEST_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _file_up_to_date(manifest, path, input_hash):
+    entry = manifest.get(os.path.basename(path))
+    if entry is None:
+        # Variants without vault JWT roles have no override file
+        return not os.path.isfile(path)
+    return (
+        entry.get("inputs") == input_hash
+        and os.path.isfile(path)
+        and _file_digest(path) == entry.get("output")
+    )
+
+
+def is_up_to_date(manifest, output_path, input_hash):
+    """True when output_path exists unmodified and was built from input_hash.
+
+    The variant's vault JWT override file is checked the same way.
+    """
+    return os.path.basename(output_path) in manifest and all(
+        _file_up_to_date(manifest, path, input_hash)
+        for path in (output_path, vault_jwt_output_path(output_path))
+    )
+
+
+def record_output(manifest, output_path, input_hash):
+    """Record the hashes of output_path and its vault JWT override file."""
+    for path in (output_path, vault_jwt_output_path(output_path)):
+        name = os.path.basename(path)
+        if os.path.isfile(path):
+            manifest[name] = {"inputs": input_hash, "output": _file_digest(path)}
+        else:
+            manifest.pop(name, None)
+
+
+def generate_incremental(
+    manifest,
+    base_path,
+    resolved_features,
+    registry_fragment_path,
+    output_path,
+    org=None,
+    image_name=None,
+    git_repo_url=None,
+    update_vault_jwt=False,
+):
+    """generate_variant, skipped when the manifest shows it is up to date.
+
+    With manifest None every variant is generated (non-incremental mode).
+    With update_vault_jwt the variant is never skipped, so its roles are
+    merged into the repo override file on every run.
+    """
+    if manifest is None:
+        generate_variant(
+            base_path,
+            FEATURES_DIR,
+            resolved_features,
+            registry_fragment_path,
+            output_path,
+            org,
+            image_name,
+            git_repo_url=git_repo_url,
+            update_vault_jwt=update_vault_jwt,
+        )
+        return True
+    input_hash = variant_input_hash(
+        base_path,
+        resolved_features,
+        registry_fragment_path,
+        org,
+        image_name,
+        git_repo_url,
+    )
+    if not update_vault_jwt and is_up_to_date(manifest, output_path, input_hash):
+        logger.info(f"  == {output_path} (up to date)")
+        return False
+    generate_variant(
+        base_path,
+        FEATURES_DIR,
+        resolved_features,
+        registry_fragment_path,
+        output_path,
+        org,
+        image_name,
+        git_repo_url=git_repo_url,
+        update_vault_jwt=update_vault_jwt,
+    )
+    record_output(manifest, output_path, input_hash)
+    return True
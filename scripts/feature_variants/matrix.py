@@ -0,0 +1,239 @@
+"""Parallel generation of every valid feature combination (--matrix)."""
+
+import logging
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from .graph import FeatureGraph
+from .incremental import (
+    is_up_to_date,
+    load_manifest,
+    record_output,
+    save_manifest,
+    variant_input_hash,
+)
+from .profiling import phase
+from .registry import (
+    FEATURES_DIR,
+    load_feature_graph,
+    registry_fragment_path,
+    repository_names,
+)
+from .variant import build_matrix_output_name, build_output_name, generate_variant
+from .yamlio import load_fragment_cached, load_yaml_cached
+
+logger = logging.getLogger(__name__)
+
+
+def _preload_inputs(base, registry_opts):
+    """Parse the base and all fragments into the in-process cache.
+
+    Called in the parent before the pool starts so forked workers share the
+    parsed trees, and as the pool initializer for spawn-based platforms.
+    """
+    load_yaml_cached(base)
+    for entry in sorted(os.listdir(FEATURES_DIR)):
+        if entry.endswith(".yaml") and entry != "features.yaml":
+            load_fragment_cached(os.path.join(FEATURES_DIR, entry))
+    for opt_info in registry_opts.values():
+        load_fragment_cached(os.path.join(FEATURES_DIR, opt_info["file"]))
+
+
+def _generate_matrix_entry(job, update_vault_jwt=False):
+    """Process-pool worker: generate one matrix variant, return its path."""
+    base, resolved, reg_path, out_path, org, image_name, git_repo = job
+    generate_variant(
+        base,
+        FEATURES_DIR,
+        resolved,
+        reg_path,
+        out_path,
+        org,
+        image_name,
+        git_repo_url=git_repo,
+        update_vault_jwt=update_vault_jwt,
+        verbose=False,
+    )
+    return out_path
+
+
+def job_inputs(job, features_dir=FEATURES_DIR):
+    """Absolute paths of the files a generation job reads."""
+    base, resolved, reg_path = job[:3]
+    paths = {os.path.abspath(base)}
+    paths.update(os.path.join(features_dir, f"{f}.yaml") for f in resolved)
+    if reg_path:
+        paths.add(os.path.abspath(reg_path))
+    return paths
+
+
+class VariantIndex:
+    """Reverse index from input files to the generation jobs that read them."""
+
+    def __init__(self, work, features_dir=FEATURES_DIR):
+        self.work = list(work)
+        self._jobs = defaultdict(list)
+        for i, job in enumerate(self.work):
+            for path in job_inputs(job, features_dir):
+                self._jobs[path].append(i)
+
+    def jobs_reading(self, path):
+        """Return the jobs that read path (a dict lookup)."""
+        return [self.work[i] for i in self._jobs.get(os.path.abspath(path), ())]
+
+    def affected(self, paths):
+        """Return the jobs that read any of paths, in plan order."""
+        hits = {i for path in paths for i in self._jobs.get(os.path.abspath(path), ())}
+        return [self.work[i] for i in sorted(hits)]
+
+
+def plan_variants(
+    base, outdir, requested, registry_option=None, git_repo=None, graph=None
+):
+    """Return the generation jobs for one requested feature list.
+
+    Jobs have the same shape as in plan_matrix: one per registry option
+    ("all" means every option), or a single one without a registry.  Without
+    a graph the registry is loaded, and re-read whenever features.yaml changes.
+    """
+    graph = graph or load_feature_graph()
+    with phase("resolve"):
+        resolved = graph.resolve(requested)
+    org, image_name, _ = repository_names(resolved, graph.feature_defs)
+    options = [None]
+    if registry_option:
+        options = graph.registry_options(registry_option)
+
+    work = []
+    for opt_num in options:
+        reg_path = None
+        if opt_num is not None:
+            reg_path = registry_fragment_path(graph.registry_opts, opt_num)
+        out_path = os.path.join(outdir, build_output_name(requested, opt_num))
+        work.append((base, resolved, reg_path, out_path, org, image_name, git_repo))
+    return work
+
+
+def plan_matrix(
+    base,
+    outdir,
+    feature_defs,
+    registry_opts,
+    registry_option,
+    git_repo,
+    graph=None,
+):
+    """Return (feature_sets, jobs, skipped) for every valid feature combination.
+
+    Each job is (base, resolved, registry fragment, output path, org,
+    image_name, git_repo).  Feature sets combining mutually exclusive
+    features are left out.  graph, when given, is the FeatureGraph of
+    feature_defs and registry_opts.  Raises RegistryOptionError for an
+    unknown registry option.
+    """
+    with phase("resolve", "matrix"):
+        graph = graph or FeatureGraph(feature_defs, registry_opts)
+        options = graph.registry_options(registry_option or "all")
+        feature_sets = graph.feature_sets()
+
+    work = []
+    skipped = 0
+    for maximal, resolved in feature_sets:
+        if not git_repo and any(
+            feature_defs[f].get("git_repo_required") for f in resolved
+        ):
+            skipped += 1
+            continue
+        org, image_name, _ = repository_names(resolved, feature_defs)
+        needs_registry = any(
+            feature_defs[f].get("registry_option_required") for f in resolved
+        )
+        for opt_num in options if needs_registry else [None]:
+            reg_path = None
+            if opt_num is not None:
+                reg_path = registry_fragment_path(registry_opts, opt_num)
+            out_name = build_matrix_output_name(maximal, opt_num)
+            work.append(
+                (
+                    base,
+                    resolved,
+                    reg_path,
+                    os.path.join(outdir, out_name),
+                    org,
+                    image_name,
+                    git_repo,
+                )
+            )
+    return feature_sets, work, skipped
+
+
+def generate_matrix(
+    base,
+    outdir,
+    feature_defs,
+    registry_opts,
+    registry_option,
+    git_repo,
+    jobs,
+    incremental=False,
+    graph=None,
+):
+    """Generate every valid feature combination in parallel.
+
+    Returns the paths written.  Raises RegistryOptionError for an unknown
+    registry option.
+    """
+    feature_sets, work, skipped = plan_matrix(
+        base, outdir, feature_defs, registry_opts, registry_option, git_repo, graph
+    )
+
+    logger.info(
+        f"Matrix:   {len(feature_sets)} feature sets -> {len(work)} variants"
+        f" ({jobs} workers)"
+    )
+    if skipped:
+        logger.info(f"          {skipped} sets skipped (need --git-repo)")
+
+    start = time.perf_counter()
+    manifest = load_manifest(outdir) if incremental else None
+    hashes = {}
+    if manifest is not None:
+        pending = []
+        for job in work:
+            out_path = job[3]
+            hashes[out_path] = variant_input_hash(
+                base, job[1], job[2], job[4], job[5], job[6]
+            )
+            if not is_up_to_date(manifest, out_path, hashes[out_path]):
+                pending.append(job)
+        logger.info(f"          {len(work) - len(pending)} variants up to date")
+        work = pending
+
+    if work:
+        _preload_inputs(base, registry_opts)
+    if jobs > 1 and len(work) > 1:
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_preload_inputs,
+            initargs=(base, registry_opts),
+        ) as pool:
+            paths = list(pool.map(_generate_matrix_entry, work, chunksize=4))
+    else:
+        paths = [_generate_matrix_entry(job) for job in work]
+    for path in paths:
+        logger.info(f"  -> {path}")
+        if manifest is not None:
+            record_output(manifest, path, hashes[path])
+    if manifest is not None:
+        save_manifest(outdir, manifest)
+    logger.info(
+        f"Generated {len(paths)} variants in {time.perf_counter() - start:.2f}s"
+    )
+    logger.info(
+        "Note: vault JWT roles are written to each variant's"
+        " values-vault-jwt-*.yaml;\n"
+        "      overrides/values-vault-jwt.yaml is not modified in matrix mode."
+    )
+    return paths
@@ -0,0 +1,233 @@
+"""Merge feature fragments into a values-hub.yaml tree."""
+
+import copy
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _is_named_list(lst):
+    """Return True if lst is a list of mappings that all contain a 'name' key."""
+    return len(lst) > 0 and all(
+        isinstance(item, dict) and "name" in item for item in lst
+    )
+
+
+def _merge_named_lists(base_list, overlay_list, index=None):
+    """Merge overlay items into base by 'name', replacing on conflict.
+
+    Overlay items are moved into base_list, not copied.  index maps names to
+    positions in base_list and is kept up to date; pass a persistent one to
+    avoid rescanning base_list on every merge.
+    """
+    if index is None:
+        index = {item["name"]: i for i, item in enumerate(base_list)}
+    for item in overlay_list:
+        name = item["name"]
+        if name in index:
+            base_list[index[name]] = item
+        else:
+            index[name] = len(base_list)
+            base_list.append(item)
+
+
+def _insert_key_before(mapping, new_key, new_value, before_key):
+    """Insert new_key into an ordered mapping just before before_key.
+
+    Plain assignment appends at the end.  The new key is appended and only
+    the keys from before_key onwards are moved behind it, so the mapping is
+    not rebuilt and comments attached to its keys are kept.
+    """
+    mapping[new_key] = new_value
+    if before_key not in mapping:
+        return
+
+    tail = []
+    for key in reversed(mapping):
+        if key == new_key:
+            continue
+        tail.append(key)
+        if key == before_key:
+            break
+    move_to_end = getattr(mapping, "move_to_end", None)
+    for key in reversed(tail):
+        if move_to_end:
+            move_to_end(key)
+        else:
+            mapping[key] = mapping.pop(key)
+
+
+class FragmentMerger:
+    """Merge feature fragments, one after another, into a single base tree.
+
+    Fragment trees are shared and read-only (see load_yaml_cached), so each
+    node taken from a fragment is deep-copied exactly once, where it enters
+    the base; the merge helpers then move the copied nodes without copying
+    them again.  Name indexes of the named lists in the base are kept for the
+    lifetime of the merger, so repeated upserts do not rescan the lists.
+
+    vault_jwt_roles collects JWT roles from all fragments for later merging
+    into the vault override file.
+    """
+
+    def __init__(self, base, vault_jwt_roles_accumulator=None):
+        self.base = base
+        if vault_jwt_roles_accumulator is None:
+            vault_jwt_roles_accumulator = []
+        self.vault_jwt_roles = vault_jwt_roles_accumulator
+        # id(list) -> (list, {name: position}); the list is held so its id
+        # cannot be reused while the index exists.
+        self._name_indexes = {}
+
+    def merge(self, fragment):
+        """Merge a single feature fragment into the base YAML tree."""
+        if fragment is None:
+            return
+
+        base = self.base
+        for top_key in fragment:
+            if top_key == "clusterGroup":
+                self._merge_cluster_group(fragment["clusterGroup"])
+            elif top_key in base and isinstance(base[top_key], dict):
+                self._merge_mappings(base[top_key], copy.deepcopy(fragment[top_key]))
+            elif top_key not in base:
+                _insert_key_before(
+                    base,
+                    top_key,
+                    copy.deepcopy(fragment[top_key]),
+                    "clusterGroup",
+                )
+            else:
+                base[top_key] = copy.deepcopy(fragment[top_key])
+
+    def _name_index(self, lst):
+        entry = self._name_indexes.get(id(lst))
+        if entry is None:
+            entry = (lst, {item["name"]: i for i, item in enumerate(lst)})
+            self._name_indexes[id(lst)] = entry
+        return entry[1]
+
+    def _merge_mappings(self, base, overlay):
+        """Recursively merge an already copied overlay into base.
+
+        Overlay wins for scalars; named lists are upserted by name and plain
+        lists are appended.
+        """
+        for key in overlay:
+            value = overlay[key]
+            current = base.get(key) if key in base else None
+            if isinstance(current, dict) and isinstance(value, dict):
+                self._merge_mappings(current, value)
+            elif isinstance(current, list) and isinstance(value, list):
+                if (
+                    id(current) in self._name_indexes
+                    or _is_named_list(current)
+                    or _is_named_list(value)
+                ):
+                    _merge_named_lists(current, value, self._name_index(current))
+                else:
+                    current.extend(value)
+            else:
+                base[key] = value
+
+    def _merge_namespaces(self, base_dict, fragment_dict):
+        """Merge namespace entries from fragment_dict into base_dict.
+
+        Namespaces are dictionaries where keys are namespace names and values
+        are their configurations (or empty/None for namespaces without config).
+        """
+        for ns_name, ns_config in fragment_dict.items():
+            if ns_name not in base_dict:
+                # Add new namespace
+                base_dict[ns_name] = copy.deepcopy(ns_config) if ns_config else None
+            elif ns_config:
+                # Merge configuration for existing namespace
+                current = base_dict[ns_name]
+                if current is None:
+                    base_dict[ns_name] = copy.deepcopy(ns_config)
+                elif isinstance(current, dict) and isinstance(ns_config, dict):
+                    self._merge_mappings(current, copy.deepcopy(ns_config))
+
+    def _apply_merge_into(self, base_apps, merge_into_spec):
+        """Handle merge_into_applications: merge into existing app configs.
+
+        merge_into_spec is a mapping like:
+            vault:
+              jwt:
+                roles: [...]
+            ztvp-certificates:
+              overrides: [...]
+
+        For each target app, recursively merge into the existing app config.
+        Named lists (items with a 'name' key) use upsert semantics; plain lists
+        are appended.
+
+        Special handling for vault JWT roles: instead of merging them into
+        clusterGroup.applications.vault, accumulate them in vault_jwt_roles
+        for later merging into the overrides/values-vault-jwt.yaml structure.
+        """
+        for app_name, additions in merge_into_spec.items():
+            # Special handling for vault JWT roles
+            if app_name == "vault" and "jwt" in additions:
+                jwt_config = additions.get("jwt", {})
+                if "roles" in jwt_config:
+                    # Accumulate JWT roles for later merging into vault
+                    # override file
+                    self.vault_jwt_roles.extend(copy.deepcopy(jwt_config["roles"]))
+                    # Leave jwt out of what is merged into the app config
+                    additions = {k: v for k, v in additions.items() if k != "jwt"}
+                    # If nothing else to merge, continue to next app
+                    if not additions:
+                        continue
+
+            if app_name not in base_apps:
+                logger.warning(
+                    "merge_into_applications target '%s' not found in base "
+                    "applications",
+                    app_name,
+                )
+                continue
+            self._merge_mappings(base_apps[app_name], copy.deepcopy(additions))
+
+    def _merge_cluster_group(self, frag_cg):
+        """Merge clusterGroup sections with type-aware strategies."""
+        base_cg = self.base.setdefault("clusterGroup", {})
+
+        if "namespaces" in frag_cg:
+            base_ns = base_cg.setdefault("namespaces", {})
+            # Ensure namespaces is a dict
+            if not isinstance(base_ns, dict):
+                logger.warning(
+                    "base namespaces is not a dict (type: %s), converting to "
+                    "empty dict",
+                    type(base_ns),
+                )
+                base_ns = {}
+                base_cg["namespaces"] = base_ns
+            self._merge_namespaces(base_ns, frag_cg["namespaces"])
+
+        if "subscriptions" in frag_cg:
+            base_subs = base_cg.setdefault("subscriptions", {})
+            for sub_name, sub_val in frag_cg["subscriptions"].items():
+                if sub_name not in base_subs:
+                    base_subs[sub_name] = copy.deepcopy(sub_val)
+
+        if "applications" in frag_cg:
+            base_apps = base_cg.setdefault("applications", {})
+            for app_name, app_val in frag_cg["applications"].items():
+                if app_name not in base_apps:
+                    base_apps[app_name] = copy.deepcopy(app_val)
+
+        if "merge_into_applications" in frag_cg:
+            base_apps = base_cg.get("applications", {})
+            self._apply_merge_into(base_apps, frag_cg["merge_into_applications"])
+
+
+def merge_fragment(base, fragment, vault_jwt_roles_accumulator):
+    """Merge a single feature fragment into the base YAML tree.
+
+    vault_jwt_roles_accumulator is a list that collects JWT roles from all fragments
+    for later merging into the vault override file.  To merge several fragments
+    into the same base, use one FragmentMerger so its indexes are reused.
+    """
+    FragmentMerger(base, vault_jwt_roles_accumulator).merge(fragment)
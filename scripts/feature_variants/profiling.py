@@ -0,0 +1,117 @@
+"""Per-phase wall time and allocation counts (--profile).
+
+Library code marks its phases with phase(name, detail).  Outside of an
+active Profiler this is a no-op; inside one, each (name, detail) pair
+accumulates its call count, wall time and the number of memory blocks it
+left allocated (sys.getallocatedblocks, so no tracing overhead).  Times and
+blocks are exclusive: a nested phase is not counted again in its parent.
+"""
+
+import contextlib
+import json
+import sys
+import time
+
+_active = None
+
+
+class Profiler:
+    """Accumulates phase measurements while active (see profiling())."""
+
+    def __init__(self):
+        self.phases = {}
+        self._stack = []
+        self._start = time.perf_counter()
+        self._end = None
+
+    @contextlib.contextmanager
+    def phase(self, name, detail=""):
+        frame = [0.0, 0]  # time and blocks of nested phases
+        self._stack.append(frame)
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            allocated = sys.getallocatedblocks() - blocks
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1][0] += elapsed
+                self._stack[-1][1] += allocated
+            entry = self.phases.setdefault((name, detail), [0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += elapsed - frame[0]
+            entry[2] += allocated - frame[1]
+
+    def stop(self):
+        self._end = time.perf_counter()
+
+    @property
+    def total(self):
+        return (self._end or time.perf_counter()) - self._start
+
+    def rows(self):
+        """Return one dict per (phase, detail), in first-seen order."""
+        return [
+            {
+                "phase": name,
+                "detail": detail,
+                "calls": calls,
+                "seconds": seconds,
+                "blocks": blocks,
+            }
+            for (name, detail), (calls, seconds, blocks) in self.phases.items()
+        ]
+
+    def to_json(self):
+        return json.dumps(
+            {"total_seconds": self.total, "phases": self.rows()}, indent=2
+        )
+
+    def format_table(self):
+        rows = self.rows()
+        total = self.total
+        pw = max([len("phase")] + [len(r["phase"]) for r in rows])
+        dw = max([len("detail")] + [len(r["detail"]) for r in rows])
+        lines = [
+            f"{'phase':{pw}s}  {'detail':{dw}s} {'calls':>7s} {'wall(s)':>9s} "
+            f"{'share':>6s} {'blocks':>9s}"
+        ]
+        other = total
+        for r in rows:
+            other -= r["seconds"]
+            lines.append(
+                f"{r['phase']:{pw}s}  {r['detail']:{dw}s} {r['calls']:7d} "
+                f"{r['seconds']:9.4f} {r['seconds'] / (total or 1):6.1%} "
+                f"{r['blocks']:9d}"
+            )
+        lines.append(
+            f"{'(other)':{pw}s}  {'':{dw}s} {'':7s} {other:9.4f} "
+            f"{other / (total or 1):6.1%}"
+        )
+        lines.append(f"{'total':{pw}s}  {'':{dw}s} {'':7s} {total:9.4f}")
+        return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def profiling(profiler):
+    """Make profiler the active one for the duration of the block.
+
+    profiler may be None, in which case nothing is measured.
+    """
+    global _active
+    previous, _active = _active, profiler
+    try:
+        yield profiler
+    finally:
+        _active = previous
+        if profiler is not None:
+            profiler.stop()
+
+
+def phase(name, detail=""):
+    """Context manager measuring a phase on the active profiler, if any."""
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.phase(name, detail)
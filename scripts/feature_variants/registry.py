@@ -0,0 +1,85 @@
+"""Feature registry (scripts/features/features.yaml) and dependency resolution."""
+
+import os
+
+from .errors import RegistryOptionError
+from .graph import FeatureGraph
+from .profiling import phase
+from .yamlio import load_yaml_file
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_ROOT = os.path.dirname(SCRIPTS_DIR)
+FEATURES_DIR = os.path.join(SCRIPTS_DIR, "features")
+REGISTRY_LABELS = {1: "quay", 2: "byo", 3: "embedded-openshift"}
+
+
+def load_feature_registry(features_dir=FEATURES_DIR):
+    registry_path = os.path.join(features_dir, "features.yaml")
+    with phase("registry load"):
+        data = load_yaml_file(registry_path)
+    return data["features"], data.get("registry_options", {})
+
+
+_graph_cache = {}
+
+
+def load_feature_graph(features_dir=FEATURES_DIR):
+    """Return the FeatureGraph of features_dir/features.yaml.
+
+    The graph is rebuilt only when features.yaml changes (by mtime and size),
+    so callers such as --watch can ask for it on every round.
+    """
+    st = os.stat(os.path.join(features_dir, "features.yaml"))
+    key = (os.path.abspath(features_dir), st.st_mtime_ns, st.st_size)
+    graph = _graph_cache.get(key)
+    if graph is None:
+        feature_defs, registry_opts = load_feature_registry(features_dir)
+        with phase("resolve", "graph"):
+            graph = FeatureGraph(feature_defs, registry_opts)
+        _graph_cache.clear()
+        _graph_cache[key] = graph
+    return graph
+
+
+def resolve_dependencies(requested, feature_defs):
+    """Topological sort: expand requested features with their transitive deps.
+
+    Raises FeatureConflictError when the result combines mutually exclusive
+    features.
+    """
+    with phase("resolve"):
+        return FeatureGraph(feature_defs).resolve(requested)
+
+
+def registry_fragment_path(registry_opts, option, features_dir=FEATURES_DIR):
+    """Return the fragment file for a numeric registry option."""
+    opt_info = registry_opts.get(option)
+    if not opt_info:
+        raise RegistryOptionError(f"no registry option {option} in features.yaml")
+    return os.path.join(features_dir, opt_info["file"])
+
+
+def repository_names(resolved, feature_defs):
+    """Return (org, image_name, defining feature) from the resolved features."""
+    org = None
+    image_name = None
+    repo_feature = None
+    for f in resolved:
+        val = feature_defs.get(f, {}).get("org")
+        if val:
+            org = val
+            repo_feature = f
+        val = feature_defs.get(f, {}).get("image_name")
+        if val:
+            image_name = val
+            repo_feature = f
+    return org, image_name, repo_feature
+
+
+def enumerate_feature_sets(feature_defs):
+    """Return every distinct dependency-closed, conflict-free feature set.
+
+    See FeatureGraph.feature_sets.
+    """
+    with phase("resolve", "matrix"):
+        return FeatureGraph(feature_defs).feature_sets()
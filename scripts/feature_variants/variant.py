@@ -0,0 +1,473 @@
+"""Render values-hub.yaml variants from the base file and feature fragments."""
+
+import copy
+import fcntl
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from urllib.parse import urlparse
+
+from .errors import (
+    InputFileNotFoundError,
+    InvalidGitRepoError,
+    MissingGitRepoError,
+    RegistryOptionError,
+)
+from .merge import FragmentMerger, _merge_named_lists
+from .profiling import phase
+from .registry import (
+    FEATURES_DIR,
+    REGISTRY_LABELS,
+    REPO_ROOT,
+    load_feature_registry,
+    registry_fragment_path,
+    repository_names,
+    resolve_dependencies,
+)
+from .yamlio import (
+    _strip_comments,
+    dump_yaml,
+    load_fragment_cached,
+    load_yaml_cached,
+    output_yaml,
+)
+
+logger = logging.getLogger(__name__)
+
+VAULT_JWT_OVERRIDE_FILE = os.path.join(REPO_ROOT, "overrides", "values-vault-jwt.yaml")
+
+
+def validate_output(data):
+    """Run basic sanity checks on the merged YAML tree.
+
+    Each problem is logged as a warning; the list of messages is returned.
+    """
+    problems = []
+    cg = data.get("clusterGroup", {})
+
+    ns_dict = cg.get("namespaces", {})
+    if isinstance(ns_dict, dict):
+        # Namespaces are now a dict, so duplicate checking is implicit
+        # (dict keys are unique by definition)
+        pass
+    else:
+        problems.append(f"namespaces is not a dict (type: {type(ns_dict)})")
+
+    apps = cg.get("applications", {})
+    for app_name, app_val in apps.items():
+        overrides = app_val.get("overrides", []) if isinstance(app_val, dict) else []
+        override_names = set()
+        for ovr in overrides:
+            name = ovr.get("name") if isinstance(ovr, dict) else None
+            if name and name in override_names:
+                problems.append(
+                    f"duplicate override '{name}' in application '{app_name}'"
+                )
+            if name:
+                override_names.add(name)
+
+    # Vault JWT roles are now in overrides/values-vault-jwt.yaml
+    # No need to validate them here as they're not in the generated variant
+
+    for problem in problems:
+        logger.warning("%s", problem)
+    return problems
+
+
+def _substitute_repository_placeholders(base, org=None, image_name=None):
+    """Replace 'org' and 'image-name' placeholders in global.registry.repository."""
+    repo = str(base.get("global", {}).get("registry", {}).get("repository", ""))
+    if org:
+        repo = repo.replace("org/", f"{org}/", 1)
+    if image_name:
+        repo = repo.replace("image-name", image_name)
+    base["global"]["registry"]["repository"] = repo
+
+
+GIT_REPO_PLACEHOLDER = "REPLACE_WITH_GIT_REPO_URL"
+GIT_HOST_PLACEHOLDER = "REPLACE_WITH_GIT_HOST"
+GIT_AUTH_TYPE_PLACEHOLDER = "REPLACE_WITH_GIT_AUTH_TYPE"
+SSL_CA_ENABLED_PLACEHOLDER = "REPLACE_WITH_SSL_CA_ENABLED"
+GIT_HOSTNAME_PLACEHOLDER = "REPLACE_WITH_GIT_HOSTNAME"
+
+PUBLIC_GIT_HOSTS = {"github.com", "gitlab.com", "bitbucket.org"}
+
+SSH_URL_RE = re.compile(r"^[\w.-]+@([\w.-]+):")
+
+
+def _parse_git_repo_url(git_repo_url):
+    """Derive (host, auth_type, hostname) from a Git repository URL.
+
+    HTTPS URLs  -> host = "https://github.com",  auth_type = "https", hostname = "github.com"
+    SSH URLs    -> host = "github.com",           auth_type = "ssh",   hostname = "github.com"
+    """
+    m = SSH_URL_RE.match(git_repo_url)
+    if m:
+        hostname = m.group(1)
+        if not hostname:
+            raise InvalidGitRepoError(f"invalid SSH URL: {git_repo_url}")
+        return hostname, "ssh", hostname
+    parsed = urlparse(git_repo_url)
+    if not parsed.hostname:
+        raise InvalidGitRepoError(f"invalid Git URL (no hostname): {git_repo_url}")
+    scheme = parsed.scheme or "https"
+    hostname = parsed.hostname or ""
+    return f"{scheme}://{hostname}", "https", hostname
+
+
+def _substitute_git_overrides(
+    base, git_repo_url, git_host, git_auth_type, git_hostname
+):
+    """Replace git-related placeholders in supply-chain and ztvp-certificates overrides."""
+    apps = base.get("clusterGroup", {}).get("applications", {})
+    is_internal = git_hostname not in PUBLIC_GIT_HOSTS
+
+    sc = apps.get("supply-chain", {})
+    sc_placeholder_map = {
+        "qtodo.repository": (GIT_REPO_PLACEHOLDER, git_repo_url),
+        "git.credentials.host": (GIT_HOST_PLACEHOLDER, git_host),
+        "git.credentials.authType": (GIT_AUTH_TYPE_PLACEHOLDER, git_auth_type),
+        "git.sslCABundle.enabled": (
+            SSL_CA_ENABLED_PLACEHOLDER,
+            "true" if is_internal else "false",
+        ),
+    }
+    sc_overrides = sc.get("overrides", [])
+    for override in sc_overrides:
+        entry = sc_placeholder_map.get(override.get("name"))
+        if entry and str(override.get("value")) == entry[0]:
+            override["value"] = entry[1]
+
+    # Remove git.sslCABundle.enabled override when false (public hosts)
+    if not is_internal:
+        sc_overrides[:] = [
+            o
+            for o in sc_overrides
+            if not (
+                o.get("name") == "git.sslCABundle.enabled" and o.get("value") == "false"
+            )
+        ]
+
+    certs = apps.get("ztvp-certificates", {})
+    certs_overrides = certs.get("overrides", [])
+    if is_internal:
+        for override in certs_overrides:
+            if (
+                override.get("name") == "customCA.remoteHosts[0]"
+                and str(override.get("value")) == GIT_HOSTNAME_PLACEHOLDER
+            ):
+                override["value"] = git_hostname
+    else:
+        # Remove the remoteHosts placeholder for public hosts
+        certs_overrides[:] = [
+            o
+            for o in certs_overrides
+            if not (
+                o.get("name") == "customCA.remoteHosts[0]"
+                and str(o.get("value")) == GIT_HOSTNAME_PLACEHOLDER
+            )
+        ]
+
+
+def _default_vault_jwt_overrides():
+    oidc_url = (
+        "https://spire-spiffe-oidc-discovery-provider"
+        ".zero-trust-workload-identity-manager.svc.cluster.local"
+    )
+    return {
+        "vault_jwt_config": True,
+        "vault_jwt_policies": [],
+        "vault_jwt_roles": [],
+        "oidc_discovery_url": oidc_url,
+    }
+
+
+def _merge_vault_jwt_roles(override_data, new_roles):
+    """Upsert new_roles by name into the vault_jwt_roles list of override_data."""
+    existing_roles = override_data.setdefault("vault_jwt_roles", [])
+    _merge_named_lists(existing_roles, copy.deepcopy(new_roles))
+    return override_data
+
+
+def render_vault_jwt_overrides(new_roles, override_file_path=VAULT_JWT_OVERRIDE_FILE):
+    """Return the vault JWT override file contents with new_roles merged in.
+
+    The repo file is only read (under a shared lock, so a concurrent locked
+    update is never seen half-written); the result is a complete override
+    file for one variant.
+    """
+    override_data = None
+    if os.path.isfile(override_file_path):
+        with open(override_file_path) as fh:
+            fcntl.flock(fh, fcntl.LOCK_SH)
+            override_data = output_yaml().load(fh)
+    if override_data is None:
+        # Missing, empty, or just created by a locked update
+        override_data = _default_vault_jwt_overrides()
+    return _merge_vault_jwt_roles(override_data, new_roles)
+
+
+def vault_jwt_output_path(output_path):
+    """Per-variant vault JWT override file written next to output_path.
+
+    values-hub-<variant>.yaml maps to values-vault-jwt-<variant>.yaml.
+    """
+    outdir, name = os.path.split(output_path)
+    stem = name[: -len(".yaml")] if name.endswith(".yaml") else name
+    if stem.startswith("values-hub-"):
+        return os.path.join(
+            outdir, f"values-vault-jwt-{stem[len('values-hub-'):]}.yaml"
+        )
+    return os.path.join(outdir, f"{stem}-vault-jwt.yaml")
+
+
+def update_vault_jwt_override_file(override_file_path, new_roles):
+    """Update the vault JWT override file with new roles from feature fragments.
+
+    Merges new_roles into the vault_jwt_roles list in the override file.
+    Uses named list semantics (upsert by role name).  The whole
+    read-modify-write runs under an exclusive lock on the file, so concurrent
+    updates are serialized instead of overwriting each other.  Returns the
+    role names.
+    """
+    if not new_roles:
+        return []
+
+    yaml = output_yaml()
+    with open(override_file_path, "a+") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        fh.seek(0)
+        override_data = yaml.load(fh)
+        if override_data is None:
+            # Create new structure if file doesn't exist
+            override_data = _default_vault_jwt_overrides()
+        _merge_vault_jwt_roles(override_data, new_roles)
+        fh.seek(0)
+        fh.truncate()
+        yaml.dump(override_data, fh)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+    return [r.get("name", "unknown") for r in new_roles]
+
+
+@dataclass
+class Variant:
+    """A rendered variant: the merged tree plus what was collected on the way."""
+
+    data: object
+    vault_jwt_roles: list = field(default_factory=list)
+    warnings: list = field(default_factory=list)
+
+    def to_yaml(self):
+        """Serialize exactly as generate_variant writes the output file."""
+        with phase("dump"):
+            return dump_yaml(self.data)
+
+
+def render_variant(
+    base_path,
+    resolved_features,
+    registry_fragment_path=None,
+    org=None,
+    image_name=None,
+    git_repo_url=None,
+    features_dir=FEATURES_DIR,
+    fragment_loader=load_fragment_cached,
+):
+    """Merge the base with the resolved fragments and return a Variant.
+
+    Nothing is written to disk.  Raises InputFileNotFoundError when the base
+    or a fragment is missing.  fragment_loader(path) returns a parsed,
+    read-only fragment.
+    """
+    if not os.path.isfile(base_path):
+        raise InputFileNotFoundError(f"base file not found: {base_path}")
+
+    # Structural copy of the cached base; fragments are only read from
+    base_tree = load_yaml_cached(base_path)
+    with phase("copy base"):
+        base = copy.deepcopy(base_tree)
+
+    # One merger for all fragments so its name indexes carry over; it also
+    # accumulates the vault JWT roles from the fragments
+    merger = FragmentMerger(base)
+
+    for feat_name in resolved_features:
+        frag_path = os.path.join(features_dir, f"{feat_name}.yaml")
+        if not os.path.isfile(frag_path):
+            raise InputFileNotFoundError(f"fragment file not found: {frag_path}")
+        fragment = fragment_loader(frag_path)
+        with phase("merge", feat_name):
+            merger.merge(fragment)
+
+    if registry_fragment_path:
+        if not os.path.isfile(registry_fragment_path):
+            raise InputFileNotFoundError(
+                f"registry fragment not found: {registry_fragment_path}"
+            )
+        registry_frag = fragment_loader(registry_fragment_path)
+        with phase("merge", os.path.basename(registry_fragment_path)):
+            merger.merge(registry_frag)
+
+    if org or image_name:
+        with phase("substitute", "repository"):
+            _substitute_repository_placeholders(base, org=org, image_name=image_name)
+
+    if git_repo_url:
+        with phase("substitute", "git"):
+            git_host, git_auth_type, git_hostname = _parse_git_repo_url(git_repo_url)
+            _substitute_git_overrides(
+                base, git_repo_url, git_host, git_auth_type, git_hostname
+            )
+
+    with phase("validate"):
+        problems = validate_output(base)
+    with phase("strip comments"):
+        cg = base.get("clusterGroup")
+        if cg:
+            for key in ("namespaces", "subscriptions", "applications"):
+                if key in cg:
+                    _strip_comments(cg[key])
+
+    return Variant(base, merger.vault_jwt_roles, problems)
+
+
+def generate_variant(
+    base_path,
+    features_dir,
+    resolved_features,
+    registry_fragment_path,
+    output_path,
+    org=None,
+    image_name=None,
+    git_repo_url=None,
+    update_vault_jwt=False,
+    verbose=True,
+):
+    """Load base, merge all feature fragments + registry option, write output.
+
+    The vault JWT roles collected from the fragments are written to the
+    variant's own override file (see vault_jwt_output_path), so concurrent
+    generations never share a file.  They are also merged into
+    overrides/values-vault-jwt.yaml only when update_vault_jwt is True.
+    Returns the collected roles.
+    """
+    variant = render_variant(
+        base_path,
+        resolved_features,
+        registry_fragment_path,
+        org,
+        image_name,
+        git_repo_url,
+        features_dir=features_dir,
+    )
+
+    with phase("dump"), open(output_path, "w") as fh:
+        output_yaml().dump(variant.data, fh)
+    if verbose:
+        logger.info(f"  -> {output_path}")
+
+    if variant.vault_jwt_roles:
+        jwt_path = vault_jwt_output_path(output_path)
+        with phase("dump", "vault-jwt"), open(jwt_path, "w") as fh:
+            output_yaml().dump(render_vault_jwt_overrides(variant.vault_jwt_roles), fh)
+        if verbose:
+            logger.info(f"  -> {jwt_path}")
+
+    if variant.vault_jwt_roles and update_vault_jwt:
+        with phase("vault jwt update"):
+            role_names = update_vault_jwt_override_file(
+                VAULT_JWT_OVERRIDE_FILE, variant.vault_jwt_roles
+            )
+        if verbose:
+            logger.info(
+                f"  Updated {VAULT_JWT_OVERRIDE_FILE} with roles: "
+                f"{', '.join(role_names)}"
+            )
+
+    return variant.vault_jwt_roles
+
+
+def build_variant(
+    features,
+    registry_option=None,
+    git_repo_url=None,
+    base_path=None,
+    features_dir=FEATURES_DIR,
+):
+    """Resolve features and render the variant in memory.
+
+    This is the library equivalent of one CLI invocation for a single
+    registry option: features are expanded with their dependencies, the
+    registry option and Git repository requirements are checked, and the
+    org/image-name placeholders are substituted.  Raises a
+    FeatureVariantError subclass on invalid input.
+    """
+    feature_defs, registry_opts = load_feature_registry(features_dir)
+    resolved = resolve_dependencies(list(features), feature_defs)
+
+    needs_registry = any(
+        feature_defs.get(f, {}).get("registry_option_required") for f in resolved
+    )
+    reg_path = None
+    if registry_option is not None:
+        try:
+            option = int(registry_option)
+        except (TypeError, ValueError):
+            raise RegistryOptionError(
+                f"invalid registry option '{registry_option}' (a variant is "
+                f"built with a single registry; use one of "
+                f"{', '.join(str(o) for o in sorted(registry_opts))})"
+            ) from None
+        reg_path = registry_fragment_path(registry_opts, option, features_dir)
+    elif needs_registry:
+        raise RegistryOptionError(
+            "a registry option is required when supply-chain feature is enabled"
+        )
+
+    needs_git_repo = any(
+        feature_defs.get(f, {}).get("git_repo_required") for f in resolved
+    )
+    if needs_git_repo and not git_repo_url:
+        raise MissingGitRepoError(
+            "a Git repository URL is required when protected-repos feature is enabled"
+        )
+
+    org, image_name, _ = repository_names(resolved, feature_defs)
+    return render_variant(
+        base_path or os.path.join(REPO_ROOT, "values-hub.yaml"),
+        resolved,
+        reg_path,
+        org if reg_path else None,
+        image_name if reg_path else None,
+        git_repo_url,
+        features_dir=features_dir,
+    )
+
+
+def build_output_name(features, registry_option=None):
+    """Construct the output filename from features and optional registry option."""
+    if "supply-chain" in features:
+        label = REGISTRY_LABELS.get(registry_option, f"option-{registry_option}")
+        suffix = "-protected-repos" if "protected-repos" in features else ""
+        return f"values-hub-supply-chain-{label}{suffix}.yaml"
+    return f"values-hub-{'-'.join(features)}.yaml"
+
+
+def build_matrix_output_name(features, registry_option=None):
+    """Like build_output_name, but unique for every feature set in the matrix.
+
+    features are the maximal features of a set.  build_output_name only
+    encodes supply-chain and protected-repos for supply-chain variants, so any
+    other features are appended, and sets that pull in supply-chain through a
+    dependency (registry_option is set) are named as supply-chain variants.
+    """
+    if registry_option is None:
+        return build_output_name(features)
+    name = build_output_name(["supply-chain", *features], registry_option)
+    extras = [f for f in features if f not in ("supply-chain", "protected-repos")]
+    if extras:
+        name = f"{name[:-len('.yaml')]}-{'-'.join(extras)}.yaml"
+    return name
@@ -0,0 +1,243 @@
+"""Regenerate variants when the base or a fragment changes (--watch)."""
+
+import ctypes
+import ctypes.util
+import fnmatch
+import functools
+import glob
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .matrix import VariantIndex, _generate_matrix_entry, _preload_inputs, job_inputs
+from .registry import FEATURES_DIR
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) event bits
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# Editors save in several steps (write a temporary file, rename, chmod);
+# events closer together than this are reported as one change.
+SETTLE_SECONDS = 0.05
+
+
+def _load_inotify():
+    """Return libc when it provides inotify, otherwise None."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, "inotify_init1") else None
+
+
+class FileWatcher:
+    """Report which files in a set of directories changed.
+
+    Uses inotify through ctypes on Linux.  Elsewhere, or when inotify cannot
+    be set up (e.g. the watch limit is reached), the directories are polled
+    and files are compared by (mtime, size).
+    """
+
+    def __init__(self, directories, pattern="*.yaml", poll_interval=0.25):
+        self.directories = sorted({os.path.abspath(d) for d in directories})
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self.fd = None
+        self.wds = {}
+        self.libc = _load_inotify()
+        if self.libc is not None:
+            self._init_inotify(self.libc)
+        if self.fd is None:
+            self.stamps = self._scan()
+
+    @property
+    def backend(self):
+        return "inotify" if self.fd is not None else "polling"
+
+    def _init_inotify(self, libc):
+        fd = libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            return
+        for directory in self.directories:
+            wd = libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                os.close(fd)
+                self.wds = {}
+                return
+            self.wds[wd] = directory
+        self.fd = fd
+
+    def set_directories(self, directories):
+        """Watch exactly directories from now on."""
+        directories = sorted({os.path.abspath(d) for d in directories})
+        if directories == self.directories:
+            return
+        if self.fd is not None:
+            for wd, directory in list(self.wds.items()):
+                if directory not in directories:
+                    self.libc.inotify_rm_watch(self.fd, wd)
+                    del self.wds[wd]
+            watched = set(self.wds.values())
+            for directory in directories:
+                if directory in watched:
+                    continue
+                wd = self.libc.inotify_add_watch(
+                    self.fd, os.fsencode(directory), WATCH_MASK
+                )
+                if wd >= 0:
+                    self.wds[wd] = directory
+        self.directories = directories
+        if self.fd is None:
+            self.stamps = self._scan()
+
+    def _scan(self):
+        stamps = {}
+        for directory in self.directories:
+            for path in glob.glob(os.path.join(directory, self.pattern)):
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                stamps[path] = (st.st_mtime_ns, st.st_size)
+        return stamps
+
+    def _read_events(self, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        buf = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(buf):
+            wd, _, _, length = INOTIFY_EVENT.unpack_from(buf, offset)
+            offset += INOTIFY_EVENT.size
+            name = buf[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if wd in self.wds and name:
+                changed.add(os.path.join(self.wds[wd], os.fsdecode(name)))
+        return {
+            p for p in changed if fnmatch.fnmatch(os.path.basename(p), self.pattern)
+        }
+
+    def _poll(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stamps = self._scan()
+            changed = {
+                path
+                for path in set(stamps) | set(self.stamps)
+                if stamps.get(path) != self.stamps.get(path)
+            }
+            self.stamps = stamps
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(self.poll_interval)
+
+    def wait(self, timeout=None):
+        """Block until files change and return their absolute paths.
+
+        Returns an empty set when timeout (seconds) expires first.
+        """
+        if self.fd is None:
+            changed = self._poll(timeout)
+            if changed:
+                time.sleep(SETTLE_SECONDS)
+                changed |= self._poll(0)
+            return changed
+        changed = self._read_events(timeout)
+        while changed:
+            more = self._read_events(SETTLE_SECONDS)
+            if not more:
+                break
+            changed |= more
+        return changed
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def _input_directories(work):
+    """Directories holding the inputs of work, plus the one with features.yaml."""
+    return {FEATURES_DIR} | {
+        os.path.dirname(path) for job in work for path in job_inputs(job)
+    }
+
+
+def watch_variants(plan, jobs=1, update_vault_jwt=False, watcher=None):
+    """Regenerate the affected variants whenever an input file changes.
+
+    plan() returns the generation jobs (see plan_matrix); it is called at
+    start and again when features.yaml changes, since dependencies and
+    registry options may have changed.  For any other change only the jobs
+    whose resolved features, registry fragment or base include the changed
+    file are regenerated.  Parsed inputs stay cached between rounds, so only
+    the changed files are parsed again.  Runs until interrupted.
+    """
+    index = VariantIndex(plan())
+    work = index.work
+    watcher = watcher or FileWatcher(_input_directories(work))
+    registry_path = os.path.join(FEATURES_DIR, "features.yaml")
+    generate = functools.partial(
+        _generate_matrix_entry, update_vault_jwt=update_vault_jwt
+    )
+
+    pool = None
+    if jobs > 1 and work and not update_vault_jwt:
+        pool = ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_preload_inputs,
+            initargs=(work[0][0], {}),
+        )
+    logger.info(
+        f"Watching {len(work)} variants ({watcher.backend}); press Ctrl-C to stop"
+    )
+    try:
+        while True:
+            changed = watcher.wait()
+            start = time.perf_counter()
+            try:
+                if registry_path in changed:
+                    index = VariantIndex(plan())
+                    work = affected = index.work
+                    watcher.set_directories(_input_directories(work))
+                else:
+                    affected = index.affected(changed)
+                if not affected:
+                    # e.g. outputs written next to the base file
+                    continue
+                if pool is not None and len(affected) > 1:
+                    paths = list(pool.map(_generate_matrix_entry, affected))
+                else:
+                    paths = [generate(job) for job in affected]
+            except Exception as e:
+                logger.error(e)
+                continue
+            for path in paths:
+                logger.info(f"  -> {path}")
+            names = ", ".join(sorted(os.path.basename(p) for p in changed))
+            logger.info(
+                f"{time.strftime('%H:%M:%S')} {names}: regenerated {len(paths)}"
+                f" of {len(work)} variants in {time.perf_counter() - start:.3f}s"
+            )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        if pool is not None:
+            pool.shutdown()
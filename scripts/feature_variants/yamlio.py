@@ -0,0 +1,213 @@
+"""YAML loading, caching and serialization for the variant generator."""
+
+import io
+import os
+import re
+
+from ruamel.yaml import YAML
+from ruamel.yaml.comments import CommentedMap, CommentedSeq
+from ruamel.yaml.nodes import ScalarNode
+from ruamel.yaml.resolver import VersionedResolver
+from ruamel.yaml.scalarstring import (
+    DoubleQuotedScalarString,
+    LiteralScalarString,
+    SingleQuotedScalarString,
+)
+
+from .errors import InputFileNotFoundError
+from .profiling import phase
+
+
+def load_yaml_file(path):
+    yaml = YAML()
+    yaml.preserve_quotes = True
+    with open(path) as fh:
+        return yaml.load(fh)
+
+
+class _NeedsRoundTrip(Exception):
+    """Raised by the fast loader for input it cannot reproduce exactly."""
+
+
+# Block-style top-level keys, to skip the fast loader early for fragments
+# that need the round-trip loader anyway
+_TOP_LEVEL_KEY_RE = re.compile(r"^([^\s#:'\"-][^:#]*):", re.MULTILINE)
+_DECIMAL_RE = re.compile(r"^[-+]?(0|[1-9][0-9]*)$")
+_BOOL_VALUES = {"true": True, "false": False}
+_QUOTED_SCALARS = {
+    '"': DoubleQuotedScalarString,
+    "'": SingleQuotedScalarString,
+    "|": LiteralScalarString,
+}
+_NO_KEY = object()
+
+
+def _fast_scalar(event, resolver):
+    if event.anchor or event.tag:
+        raise _NeedsRoundTrip("tagged or anchored scalar")
+    if event.style in _QUOTED_SCALARS:
+        return _QUOTED_SCALARS[event.style](event.value)
+    if event.style:
+        # Folded scalars keep their fold positions only in the round-trip loader
+        raise _NeedsRoundTrip("folded scalar")
+    value = event.value
+    tag = str(resolver.resolve(ScalarNode, value, (True, False)))
+    if tag == "tag:yaml.org,2002:str":
+        return value
+    if tag == "tag:yaml.org,2002:null":
+        return None
+    if tag == "tag:yaml.org,2002:bool":
+        return _BOOL_VALUES[value.lower()]
+    if tag == "tag:yaml.org,2002:int" and _DECIMAL_RE.match(value):
+        return int(value)
+    # Floats, timestamps, hex/octal ints: round-trip types keep their format
+    raise _NeedsRoundTrip(f"scalar {value!r} ({tag})")
+
+
+def _fast_load(stream):
+    """Build round-trip containers directly from parser events.
+
+    Quote, literal-block and flow styles are kept, comments are dropped, and
+    no node graph is composed.  Raises _NeedsRoundTrip for anything whose
+    round-trip representation the events do not determine (anchors, tags,
+    folded blocks, floats, duplicate or complex keys, several documents).
+    """
+    resolver = VersionedResolver()
+    root = None
+    documents = 0
+    stack = []  # [container, pending mapping key]
+
+    def add(value):
+        nonlocal root
+        if not stack:
+            root = value
+            return
+        top = stack[-1]
+        container = top[0]
+        if isinstance(container, list):
+            container.append(value)
+        elif top[1] is _NO_KEY:
+            if isinstance(value, (dict, list)):
+                raise _NeedsRoundTrip("complex mapping key")
+            top[1] = value
+        else:
+            if top[1] in container:
+                raise _NeedsRoundTrip(f"duplicate key {top[1]!r}")
+            container[top[1]] = value
+            top[1] = _NO_KEY
+
+    for event in YAML(typ="safe").parse(stream):
+        kind = type(event).__name__
+        if kind == "ScalarEvent":
+            add(_fast_scalar(event, resolver))
+        elif kind in ("MappingStartEvent", "SequenceStartEvent"):
+            if event.anchor or event.tag:
+                raise _NeedsRoundTrip("tagged or anchored collection")
+            node = CommentedMap() if kind == "MappingStartEvent" else CommentedSeq()
+            if event.flow_style:
+                node.fa.set_flow_style()
+            else:
+                node.fa.set_block_style()
+            add(node)
+            stack.append([node, _NO_KEY])
+        elif kind in ("MappingEndEvent", "SequenceEndEvent"):
+            stack.pop()
+        elif kind == "AliasEvent":
+            raise _NeedsRoundTrip("alias")
+        elif kind == "DocumentStartEvent":
+            documents += 1
+            if documents > 1:
+                raise _NeedsRoundTrip("several documents")
+    return root
+
+
+def load_fragment_file(path):
+    """Load a feature fragment, using the fast event-based loader if possible.
+
+    Fragments usually only contain clusterGroup, whose comments never reach
+    the output (_strip_comments).  Those are built by _fast_load, skipping the
+    comment handling and node composition of the round-trip loader while
+    keeping quoting, so the generated files are identical.  Fragments with
+    other top-level sections (e.g. global in the registry options, whose
+    comments are kept) and input _fast_load cannot reproduce exactly are
+    loaded with the round-trip loader.
+    """
+    with open(path) as fh:
+        text = fh.read()
+    if set(_TOP_LEVEL_KEY_RE.findall(text)) <= {"clusterGroup"}:
+        try:
+            data = _fast_load(text)
+        except _NeedsRoundTrip:
+            pass
+        else:
+            if not isinstance(data, dict) or set(data) <= {"clusterGroup"}:
+                return data
+    yaml = YAML()
+    yaml.preserve_quotes = True
+    return yaml.load(text)
+
+
+# Parsed round-trip trees keyed by absolute path and loader, each stored with
+# the file's (mtime, size) so an edited file is parsed again.  Parsing
+# dominates generation time, so every file is parsed at most once per process.
+_parsed_cache = {}
+
+
+def load_yaml_cached(path, loader=load_yaml_file):
+    """Return the parsed tree for path, parsing it only on first use.
+
+    The returned tree is shared between callers and must be treated as
+    read-only; merges copy what they insert.  Use copy.deepcopy() to get a
+    tree that can be modified in place (as done for the base file).
+    """
+    key = os.path.abspath(path)
+    try:
+        st = os.stat(key)
+    except FileNotFoundError:
+        raise InputFileNotFoundError(f"file not found: {path}") from None
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _parsed_cache.get((key, loader))
+    if cached is None or cached[0] != stamp:
+        with phase("parse", os.path.basename(key)):
+            cached = (stamp, loader(key))
+        _parsed_cache[(key, loader)] = cached
+    return cached[1]
+
+
+def load_fragment_cached(path):
+    """load_yaml_cached for fragments, see load_fragment_file."""
+    return load_yaml_cached(path, load_fragment_file)
+
+
+def output_yaml():
+    """Return the YAML instance used to serialize generated files."""
+    yaml = YAML()
+    yaml.preserve_quotes = True
+    yaml.default_flow_style = False
+    yaml.width = 4096
+    return yaml
+
+
+def dump_yaml(data):
+    """Serialize a tree exactly as it is written to generated files."""
+    buf = io.StringIO()
+    output_yaml().dump(data, buf)
+    return buf.getvalue()
+
+
+def _strip_comments(node):
+    """Recursively remove all ruamel.yaml comments from a YAML subtree."""
+    if isinstance(node, CommentedMap):
+        node.ca.comment = None
+        node.ca.items.clear()
+        if hasattr(node.ca, "end"):
+            node.ca.end = None
+        for v in node.values():
+            _strip_comments(v)
+    elif isinstance(node, CommentedSeq):
+        node.ca.comment = None
+        node.ca.items.clear()
+        if hasattr(node.ca, "end"):
+            node.ca.end = None
+        for item in node:
+            _strip_comments(item)
@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feature_variants import (  # noqa: E402
+    dump_yaml,
+    render_vault_jwt_overrides,
+    update_vault_jwt_override_file,
+)
+
+ROLES = [{"name": "qtodo", "audience": "qtodo", "policies": ["qtodo-secret"]}]
+
+
+def test_render_against_empty_override_file(tmp_path):
+    override_file = tmp_path / "values-vault-jwt.yaml"
+    override_file.write_text("")
+
+    rendered = render_vault_jwt_overrides(ROLES, str(override_file))
+
+    assert rendered["vault_jwt_config"] is True
+    assert [r["name"] for r in rendered["vault_jwt_roles"]] == ["qtodo"]
+    assert "name: qtodo" in dump_yaml(rendered)
+
+
+def test_render_matches_locked_update_of_empty_file(tmp_path):
+    rendered_file = tmp_path / "rendered.yaml"
+    rendered_file.write_text("")
+    updated_file = tmp_path / "updated.yaml"
+    updated_file.write_text("")
+
+    rendered = render_vault_jwt_overrides(ROLES, str(rendered_file))
+    update_vault_jwt_override_file(str(updated_file), ROLES)
+
+    assert dump_yaml(rendered) == updated_file.read_text()
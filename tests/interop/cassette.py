@@ -0,0 +1,411 @@
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import kubernetes
+import pytest
+import requests
+import urllib3
+from kubernetes.dynamic import DynamicClient
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from . import __loggername__
+
+logger = logging.getLogger(__loggername__)
+
+# Directory to record cassettes to, or to replay them from; one cassette per
+# pytest session, named after the test files it runs.
+RECORD_DIR = os.getenv("INTEROP_RECORD")
+REPLAY_DIR = os.getenv("INTEROP_REPLAY")
+
+# Query parameters that change between runs without changing the answer.
+VOLATILE_PARAMS = frozenset({"timeoutSeconds"})
+
+# Response headers kept in a cassette.
+KEPT_HEADERS = ("Content-Type", "Content-Encoding", "Location")
+
+# Stand-in for every value of a recorded Secret (data holds base64 values).
+REDACTED = "redacted"
+REDACTED_DATA = base64.b64encode(REDACTED.encode()).decode()
+LAST_APPLIED = "kubectl.kubernetes.io/last-applied-configuration"
+
+_active = None
+
+
+def _digest(body):
+    if not body:
+        return ""
+    if isinstance(body, str):
+        body = body.encode()
+    return hashlib.sha256(body).hexdigest()
+
+
+def _api_key(method, url, body):
+    """Match API requests on method, path, stable query parameters and body."""
+    parts = urlsplit(url)
+    query = [
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in VOLATILE_PARAMS
+    ]
+    path = parts.path + (f"?{urlencode(query)}" if query else "")
+    return ("api", method.upper(), path, _digest(body))
+
+
+def _http_key(method, url, body):
+    return ("http", method.upper(), url, _digest(body))
+
+
+def _is_watch(url):
+    query = dict(parse_qsl(urlsplit(url).query))
+    return query.get("watch", "false").lower() not in ("false", "0")
+
+
+def _redact_secret(secret):
+    for key, value in (("data", REDACTED_DATA), ("stringData", REDACTED)):
+        if isinstance(secret.get(key), dict):
+            secret[key] = dict.fromkeys(secret[key], value)
+    annotations = (secret.get("metadata") or {}).get("annotations") or {}
+    if LAST_APPLIED in annotations:
+        annotations[LAST_APPLIED] = REDACTED
+
+
+def _redact_object(obj):
+    """Redact the Secrets in an API object, list or watch event, in place."""
+    if not isinstance(obj, dict):
+        return
+    if obj.get("kind") == "Secret":
+        _redact_secret(obj)
+    elif obj.get("kind") == "SecretList":
+        # List items carry no kind of their own
+        for item in obj.get("items") or []:
+            if isinstance(item, dict):
+                _redact_secret(item)
+    elif isinstance(obj.get("items"), list):
+        for item in obj["items"]:
+            _redact_object(item)
+    if obj.get("type") and isinstance(obj.get("object"), dict):
+        _redact_object(obj["object"])
+
+
+def redact_secrets(body):
+    """Return an API response body with the values of Secrets replaced.
+
+    Handles single objects, lists and watch streams (one event per line).
+    """
+    if b"Secret" not in body:
+        return body
+    try:
+        obj = json.loads(body)
+    except ValueError:
+        lines = body.split(b"\n")
+        for i, line in enumerate(lines):
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            _redact_object(event)
+            lines[i] = json.dumps(event).encode()
+        return b"\n".join(lines)
+    _redact_object(obj)
+    return json.dumps(obj).encode()
+
+
+class Cassette:
+    """Recorded cluster API and route HTTP interactions, in the order they happened.
+
+    When replaying, the interactions recorded for the same request are served
+    in order; the last one is repeated once they run out, as a resource
+    polled after the recording ended would still be in its last state.
+    """
+
+    def __init__(self, path, mode, interactions=None):
+        self.path = path
+        self.mode = mode
+        self.interactions = interactions or []
+        self.misses = []
+        self._lock = threading.Lock()
+        self._queues = {}
+        for interaction in self.interactions:
+            self._queues.setdefault(self._key(interaction), []).append(interaction)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(path, "replay", json.load(f)["interactions"])
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump({"interactions": self.interactions}, f, indent=1)
+        logger.info(f"Recorded {len(self.interactions)} interactions to {self.path}")
+
+    @staticmethod
+    def _key(interaction):
+        return (
+            interaction["kind"],
+            interaction["method"],
+            interaction["url"],
+            interaction["body_digest"],
+        )
+
+    def record(self, key, status, reason, headers, body):
+        kind, method, url, body_digest = key
+        headers = {k.lower(): v for k, v in headers.items()}
+        if kind == "api":
+            body = redact_secrets(body)
+        try:
+            text, encoding = body.decode("utf-8"), "utf-8"
+        except UnicodeDecodeError:
+            text, encoding = base64.b64encode(body).decode(), "base64"
+        with self._lock:
+            self.interactions.append(
+                {
+                    "kind": kind,
+                    "method": method,
+                    "url": url,
+                    "body_digest": body_digest,
+                    "status": status,
+                    "reason": reason,
+                    "headers": {
+                        k: headers[k.lower()]
+                        for k in KEPT_HEADERS
+                        if k.lower() in headers
+                    },
+                    "body": text,
+                    "encoding": encoding,
+                }
+            )
+
+    def play(self, key):
+        """Return (status, reason, headers, body) recorded for key, or None."""
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                self.misses.append(key)
+                logger.warning(f"Not in cassette {self.path}: {key[1]} {key[2]}")
+                return None
+            interaction = queue.pop(0) if len(queue) > 1 else queue[0]
+        body = interaction["body"]
+        if interaction["encoding"] == "base64":
+            body = base64.b64decode(body)
+        else:
+            body = body.encode("utf-8")
+        return (
+            interaction["status"],
+            interaction["reason"],
+            interaction["headers"],
+            body,
+        )
+
+    def attach(self, session):
+        """Record or replay the route requests made through a requests.Session."""
+        if self.mode == "record":
+            session.hooks["response"].append(self._record_response)
+        else:
+            adapter = ReplayAdapter(self)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+
+    def _record_response(self, response, *args, **kwargs):
+        request = response.request
+        self.record(
+            _http_key(request.method, request.url, request.body),
+            response.status_code,
+            response.reason,
+            {
+                k: v
+                for k, v in response.headers.items()
+                if k.lower() != "content-encoding"
+            },
+            response.content,
+        )
+
+
+class _TeeResponse:
+    """A streamed urllib3 response that records the bytes read through it."""
+
+    def __init__(self, response, on_close):
+        self._response = response
+        self._chunks = []
+        self._on_close = on_close
+
+    def stream(self, *args, **kwargs):
+        for chunk in self._response.stream(*args, **kwargs):
+            self._chunks.append(chunk)
+            yield chunk
+
+    def read(self, *args, **kwargs):
+        data = self._response.read(*args, **kwargs)
+        self._chunks.append(data)
+        return data
+
+    def close(self):
+        self._response.close()
+        if self._on_close is not None:
+            self._on_close(b"".join(self._chunks))
+            self._on_close = None
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+def record_api(cassette, dyn_client):
+    """Record every API request dyn_client makes into cassette.
+
+    Requests are captured where the kubernetes client hands them to urllib3,
+    so responses are recorded exactly as the API server sent them.  Watch
+    streams are recorded up to the point the caller stops reading.
+    """
+    pool = dyn_client.client.rest_client.pool_manager
+    urlopen = pool.urlopen
+
+    def recording_urlopen(method, url, *args, **kwargs):
+        response = urlopen(method, url, *args, **kwargs)
+        key = _api_key(method, url, kwargs.get("body"))
+        if _is_watch(url):
+            return _TeeResponse(
+                response,
+                lambda data: cassette.record(
+                    key, response.status, response.reason, response.headers, data
+                ),
+            )
+        data = response.data
+        headers = {
+            k: v for k, v in response.headers.items() if k.lower() != "content-encoding"
+        }
+        cassette.record(key, response.status, response.reason, headers, data)
+        return urllib3.HTTPResponse(
+            body=io.BytesIO(data),
+            headers=headers,
+            status=response.status,
+            reason=response.reason,
+            preload_content=kwargs.get("preload_content", True),
+        )
+
+    pool.urlopen = recording_urlopen
+    # Discover the API again, so the discovery requests are recorded too.
+    dyn_client.resources.invalidate_cache()
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _replay(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else None
+        played = self.server.cassette.play(_api_key(self.command, self.path, body))
+        if played is None:
+            status, reason, headers = 501, "Not Recorded", {}
+            body = json.dumps(
+                {
+                    "kind": "Status",
+                    "apiVersion": "v1",
+                    "status": "Failure",
+                    "message": f"{self.command} {self.path} is not in the cassette",
+                    "code": 501,
+                }
+            ).encode()
+            headers = {"Content-Type": "application/json"}
+        else:
+            status, reason, headers, body = played
+        self.send_response(status, reason)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_HEAD = do_POST = do_PUT = do_PATCH = do_DELETE = _replay
+
+    def log_message(self, format, *args):
+        logger.debug(f"Replay server: {format % args}")
+
+
+class ReplayServer:
+    """A local stand-in API server answering from a cassette."""
+
+    def __init__(self, cassette):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _ReplayHandler)
+        self.httpd.cassette = cassette
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logger.info(f"Replaying {self.httpd.cassette.path} at {self.url}")
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def client(self, cache_dir):
+        """Return a DynamicClient talking to this server."""
+        configuration = kubernetes.client.Configuration()
+        configuration.host = self.url
+        return DynamicClient(
+            kubernetes.client.ApiClient(configuration),
+            cache_file=os.path.join(cache_dir, "discovery.json"),
+        )
+
+
+class ReplayAdapter(BaseAdapter):
+    """A requests transport answering route requests from a cassette."""
+
+    def __init__(self, cassette):
+        super().__init__()
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        played = self.cassette.play(
+            _http_key(request.method, request.url, request.body)
+        )
+        if played is None:
+            raise requests.ConnectionError(
+                f"{request.method} {request.url} is not in the cassette",
+                request=request,
+            )
+        status, reason, headers, body = played
+        response = requests.Response()
+        response.status_code = status
+        response.reason = reason
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def open_cassette(name):
+    """Start recording to, or replaying from, the cassette called name.
+
+    Does nothing unless INTEROP_RECORD or INTEROP_REPLAY is set.
+    """
+    global _active
+    if REPLAY_DIR:
+        path = os.path.join(REPLAY_DIR, f"{name}.json")
+        if not os.path.isfile(path):
+            raise pytest.UsageError(
+                f"INTEROP_REPLAY: no cassette at {path}; record one first by "
+                f"running the same test files with INTEROP_RECORD={REPLAY_DIR}"
+            )
+        _active = Cassette.load(path)
+    elif RECORD_DIR:
+        _active = Cassette(os.path.join(RECORD_DIR, f"{name}.json"), "record")
+    return _active
+
+
+def active_cassette():
+    return _active
@@ -4,6 +4,57 @@ import pytest
 from validatedpatterns_tests.interop.conftest_logger import *  # noqa: F401, F403
 from validatedpatterns_tests.interop.conftest_openshift import *  # noqa: F401, F403
 
+from . import cassette, timing
+from .snapshot import snapshot_cache
+
+
+def pytest_configure(config):
+    names = [
+        os.path.splitext(os.path.basename(arg.split("::")[0]))[0] for arg in config.args
+    ]
+    cassette.open_cassette("-".join(names) or "session")
+    config.pluginmanager.register(timing.CallTimingPlugin(), "interop-call-timing")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def api_cassette(request):
+    """Record the session's cluster API traffic when INTEROP_RECORD is set."""
+    active = cassette.active_cassette()
+    if active is None or active.mode != "record":
+        yield active
+        return
+    cassette.record_api(active, request.getfixturevalue("openshift_dyn_client"))
+    yield active
+    active.save()
+
+
+if cassette.REPLAY_DIR:
+
+    @pytest.fixture(scope="session")
+    def openshift_dyn_client(tmp_path_factory):
+        """Replace the cluster with a local server replaying the cassette."""
+        server = cassette.ReplayServer(cassette.active_cassette())
+        server.start()
+        yield server.client(str(tmp_path_factory.mktemp("discovery")))
+        server.stop()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def api_call_timing(openshift_dyn_client):
+    """Time the session's cluster API calls (see timing.CallTimingPlugin)."""
+    timing.time_api_calls(openshift_dyn_client)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def resource_snapshots():
+    """Listings shared by the utils helpers for the whole session.
+
+    Tests that create, delete or restart resources should call
+    resource_snapshots.invalidate(Kind, namespace) before checking them.
+    """
+    yield snapshot_cache
+    snapshot_cache.clear()
+
 
 @pytest.fixture
 def cluster_name():
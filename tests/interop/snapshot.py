@@ -0,0 +1,128 @@
+import logging
+import os
+import threading
+import time
+
+from . import __loggername__
+
+logger = logging.getLogger(__loggername__)
+
+# Seconds a cached listing or GET stays fresh; 0 disables the cache.
+DEFAULT_TTL = float(os.getenv("INTEROP_SNAPSHOT_TTL", "60"))
+
+
+def _list_items(resource_cls, dyn_client, namespace=None, **selectors):
+    """LIST resource_cls once and return the raw items (ResourceField objects).
+
+    selectors (label_selector, field_selector) are passed to the API server,
+    which does the filtering.  The raw items carry metadata, spec and status,
+    so matching on them costs no further API calls (each .instance of a
+    Resource object is a GET).
+    """
+    kwargs = {k: v for k, v in selectors.items() if v}
+    if namespace:
+        kwargs["namespace"] = namespace
+    items = []
+    for obj in resource_cls.get(dyn_client=dyn_client, raw=True, **kwargs):
+        if isinstance(getattr(obj, "items", None), list):
+            # Cluster-scoped kinds yield the whole list object for every item.
+            return list(obj.items)
+        items.append(obj)
+    return items
+
+
+class ResourceSnapshotCache:
+    """Session-wide listings of (kind, namespace), served from memory.
+
+    Each (kind, namespace, selectors) is listed once, and each resource
+    fetched by name once; the result is reused until it is older than ttl
+    seconds or invalidate() drops it.  Tests that change the resources a
+    helper looks at should invalidate the affected kind and namespace.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, key, fetch):
+        now = self.clock()
+        with self._lock:
+            entry = self._snapshots.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self.hits += 1
+                return entry[1]
+        value = fetch()
+        with self._lock:
+            self.misses += 1
+            if self.ttl > 0:
+                self._snapshots[key] = (now, value)
+        return value
+
+    def list(
+        self,
+        resource_cls,
+        dyn_client,
+        namespace=None,
+        label_selector=None,
+        field_selector=None,
+    ):
+        """Return the raw items of resource_cls in namespace (all if None).
+
+        Listings with different selectors are cached separately.
+        """
+        key = (
+            resource_cls,
+            namespace,
+            id(dyn_client),
+            ("list", label_selector, field_selector),
+        )
+
+        def fetch():
+            items = _list_items(
+                resource_cls,
+                dyn_client,
+                namespace,
+                label_selector=label_selector,
+                field_selector=field_selector,
+            )
+            selectors = ",".join(s for s in (label_selector, field_selector) if s)
+            logger.debug(
+                f"Listed {len(items)} {resource_cls.kind} in "
+                f'"{namespace or "<cluster>"}" matching "{selectors or "*"}"'
+            )
+            return items
+
+        return self._cached(key, fetch)
+
+    def get(self, resource_cls, dyn_client, name, namespace=None):
+        """Return the instance of one resource by name, or None if it is absent.
+
+        This is a single GET, not a listing of the kind.
+        """
+        key = (resource_cls, namespace, id(dyn_client), ("get", name))
+        kwargs = {"namespace": namespace} if namespace else {}
+
+        def fetch():
+            return resource_cls(client=dyn_client, name=name, **kwargs).exists
+
+        return self._cached(key, fetch)
+
+    def invalidate(self, resource_cls=None, namespace=None):
+        """Drop what is cached for resource_cls and/or namespace (all if both None)."""
+        with self._lock:
+            for key in list(self._snapshots):
+                if resource_cls is not None and key[0] is not resource_cls:
+                    continue
+                if namespace is not None and key[1] != namespace:
+                    continue
+                del self._snapshots[key]
+
+    def clear(self):
+        self.invalidate()
+
+
+snapshot_cache = ResourceSnapshotCache()
@@ -11,6 +11,7 @@ from validatedpatterns_tests.interop import components
 
 from . import __loggername__, pattern_crd
 from .utils import (
+    probe_endpoints,
     run_shell_script,
     verify_pod_by_deployment,
     verify_pod_in_project,
@@ -202,16 +203,20 @@ def test_quay_services(openshift_dyn_client):
 
     quay_base_url = f"https://{quay_route.host}"
     quay_health_endpoint = requests.compat.urljoin(quay_base_url, "/health/instance")
-    rsp = wait_for(app_url=quay_health_endpoint)
-    assert rsp.status_code == requests.codes.ok
-
     quay_docker_v2_endpoint = requests.compat.urljoin(quay_base_url, "/v2")
-    rsp = wait_for(app_url=quay_docker_v2_endpoint)
-    assert rsp.status_code == requests.codes.unauthorized
-
     quay_catalog_endpoint = requests.compat.urljoin(quay_base_url, "/v2/_catalog")
-    rsp = wait_for(app_url=quay_catalog_endpoint)
-    assert rsp.status_code == requests.codes.ok
+    results = probe_endpoints(
+        {
+            quay_health_endpoint: None,
+            quay_docker_v2_endpoint: None,
+            quay_catalog_endpoint: None,
+        }
+    )
+    assert results[quay_health_endpoint]["status_code"] == requests.codes.ok
+    assert (
+        results[quay_docker_v2_endpoint]["status_code"] == requests.codes.unauthorized
+    )
+    assert results[quay_catalog_endpoint]["status_code"] == requests.codes.ok
 
     quay_api_endpoint = requests.compat.urljoin(quay_base_url, "/api/v1/user/")
 
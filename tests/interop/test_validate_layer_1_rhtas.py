@@ -9,7 +9,7 @@ from ocp_resources.secret import Secret
 from ocp_resources.service import Service
 
 from . import __loggername__, pattern_crd
-from .utils import verify_pod_by_deployment, wait_for
+from .utils import probe_endpoints, verify_pod_by_deployment
 
 logger = logging.getLogger(__loggername__)
 
@@ -161,7 +161,8 @@ def test_rhtas_service_endpoints(openshift_dyn_client):
         },
     }
 
-    # Verify each service ingress exists and is reachable
+    # Verify each service ingress exists
+    endpoints = {}
     for component_name, config in components.items():
         logger.info(f"Checking ingress for component: {component_name}")
 
@@ -182,19 +183,19 @@ def test_rhtas_service_endpoints(openshift_dyn_client):
             )
             continue
 
-        # Build and test endpoint
+        # Build the endpoint to test
         base_url = f"https://{ingress_host}"
         endpoint_url = requests.compat.urljoin(base_url, config["endpoint"])
+        endpoints[endpoint_url] = config["status_codes"]
 
-        logger.info(f"Testing endpoint: {endpoint_url}")
-        rsp = wait_for(
-            app_url=endpoint_url, acceptable_status_codes=config["status_codes"]
-        )
-
-        err_msg = f'FAIL: Endpoint {endpoint_url} returned unexpected status {rsp.status_code if rsp else "None"}'
-        assert rsp is not None and rsp.status_code in config["status_codes"], err_msg
+    # Verify all endpoints are reachable, probing them concurrently
+    logger.info(f"Testing endpoints: {list(endpoints)}")
+    for endpoint_url, result in probe_endpoints(endpoints).items():
+        err_msg = f'FAIL: Endpoint {endpoint_url} returned unexpected status {result["status_code"]}'
+        assert result["success"], err_msg
         logger.info(
-            f"PASS: Endpoint {endpoint_url} is reachable (status: {rsp.status_code})"
+            f"PASS: Endpoint {endpoint_url} is reachable "
+            f"(status: {result['status_code']}, latency: {result['latency']:.3f}s)"
         )
 
     logger.info("PASS: All RHTAS service endpoints are reachable")
@@ -12,7 +12,13 @@ from ocp_resources.route import Route
 from ocp_resources.secret import Secret
 
 from . import __loggername__, pattern_crd
-from .utils import render_yaml_template, run_cmds, wait_for
+from .utils import (
+    render_yaml_template,
+    run_cmds,
+    wait_for,
+    wait_for_phase,
+    wait_for_resource_condition,
+)
 
 logger = logging.getLogger(__loggername__)
 
@@ -193,7 +199,7 @@ def rhtas_signing_test_project(openshift_dyn_client):
             f'Project "{rhtas_signing_test_namespace}" does not exist and needs to be created'
         )
         project.deploy()
-        project.wait_for_status(status=Project.Status.ACTIVE, timeout=120)
+        assert wait_for_phase(project, Project.Status.ACTIVE, timeout=120)
     assert project.exists
 
     yield project
@@ -253,8 +259,8 @@ def rhtas_signer_pod(
         # Close when done (auto-deleted if delete=True)
         temp_file.close()
 
-        rhtas_signer_pod.wait_for_condition(
-            condition=Pod.Condition.READY, status=Pod.Condition.Status.TRUE
+        assert wait_for_resource_condition(
+            rhtas_signer_pod, Pod.Condition.READY, Pod.Condition.Status.TRUE
         )
         assert rhtas_signer_pod.exists
     yield rhtas_signer_pod
@@ -0,0 +1,131 @@
+import contextlib
+import os
+import shlex
+import threading
+import time
+
+import pytest
+from ocp_resources.pod import Pod
+
+# Number of calls listed in the slowest-calls report; 0 disables the report.
+SLOWEST_CALLS = int(os.getenv("INTEROP_SLOWEST_CALLS", "20"))
+
+# Calls made outside of any test (session fixtures set up before the first
+# test are attributed to it, as pytest runs them in its setup).
+NO_TEST = "(session)"
+
+_active = None
+
+
+@contextlib.contextmanager
+def timed(kind, name):
+    """Time a call of kind (api, exec, http or wait) on the active plugin, if any."""
+    if _active is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _active.add(kind, name, time.perf_counter() - start)
+
+
+def time_api_calls(dyn_client):
+    """Time every request dyn_client makes, discovery included."""
+    request = dyn_client.request
+
+    def timed_request(method, path, *args, **kwargs):
+        verb = "WATCH" if kwargs.get("watch") else method.upper()
+        with timed("api", f"{verb} {path}"):
+            return request(method, path, *args, **kwargs)
+
+    dyn_client.request = timed_request
+
+
+class CallTimingPlugin:
+    """Times cluster API calls, pod.execute, HTTP requests and waits per test.
+
+    Each test gets <kind>_calls and <kind>_seconds JUnit properties and its
+    slowest call; the session ends with a report of the slowest calls and
+    the time spent per kind.  wait calls include the probes they make.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.current = NO_TEST
+        self._by_test = {}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._execute = None
+
+    def add(self, kind, name, seconds):
+        with self._lock:
+            call = (seconds, kind, name, self.current)
+            self.calls.append(call)
+            self._by_test.setdefault(self.current, []).append(call)
+
+    def pytest_configure(self, config):
+        global _active
+        _active = self
+        execute = self._execute = Pod.execute
+
+        def timed_execute(pod, *args, **kwargs):
+            command = args[0] if args else kwargs.get("command", [])
+            if not isinstance(command, str):
+                command = shlex.join(command)
+            with timed("exec", f"{pod.namespace}/{pod.name} {command}"):
+                return execute(pod, *args, **kwargs)
+
+        Pod.execute = timed_execute
+
+    def pytest_unconfigure(self, config):
+        global _active
+        _active = None
+        if self._execute is not None:
+            Pod.execute = self._execute
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        self.current = item.nodeid
+        yield
+        self.current = NO_TEST
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        if call.when == "teardown":
+            with self._lock:
+                calls = list(self._by_test.get(item.nodeid, []))
+            totals = {}
+            for seconds, kind, _, _ in calls:
+                count, total = totals.get(kind, (0, 0.0))
+                totals[kind] = (count + 1, total + seconds)
+            for kind, (count, total) in sorted(totals.items()):
+                item.user_properties.append((f"{kind}_calls", count))
+                item.user_properties.append((f"{kind}_seconds", f"{total:.3f}"))
+            if calls:
+                seconds, kind, name, _ = max(calls)
+                item.user_properties.append(
+                    ("slowest_call", f"{kind} {name} ({seconds:.3f}s)")
+                )
+        yield
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if not SLOWEST_CALLS or not self.calls:
+            return
+        write = terminalreporter.write_line
+        terminalreporter.write_sep(
+            "=", "slowest cluster API, exec, HTTP and wait calls"
+        )
+        slowest = sorted(self.calls, reverse=True)[:SLOWEST_CALLS]
+        for seconds, kind, name, test in slowest:
+            write(f"{seconds:9.3f}s {kind:5s} {name}  [{test}]")
+        elapsed = time.perf_counter() - self._start
+        write("")
+        write("Time per kind (concurrent calls, and waits with their probes, overlap):")
+        for kind in ("api", "exec", "http", "wait"):
+            seconds = [c[0] for c in self.calls if c[1] == kind]
+            if seconds:
+                write(
+                    f"{kind:5s} {len(seconds):6d} calls {sum(seconds):10.3f}s "
+                    f"({sum(seconds) / elapsed:6.1%} of {elapsed:.1f}s session)"
+                )
@@ -2,10 +2,14 @@ import logging
 import os
 import subprocess
 import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 
 import requests
 from jinja2 import Template
+from kubernetes.client.exceptions import ApiException
 from ocp_resources.pod import Pod
 from ocp_resources.project_project_openshift_io import Project
 from ocp_resources.replica_set import ReplicaSet
@@ -15,17 +19,43 @@ from requests import HTTPError, RequestException
 from urllib3.exceptions import InsecureRequestWarning
 
 from . import __loggername__
+from .cassette import active_cassette
+from .snapshot import snapshot_cache
+from .timing import timed
 
 logger = logging.getLogger(__loggername__)
 
 
+# Suppress only the single warning from urllib3 needed.
+requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
+
+# Per thread, (scheme, host) -> requests.Session, so requests to one host reuse
+# connections; requests.Session is not safe to share between threads.
+_local = threading.local()
+
+
+def _session_for(url):
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    sessions = getattr(_local, "sessions", None)
+    if sessions is None:
+        sessions = _local.sessions = {}
+    session = sessions.get(key)
+    if session is None:
+        session = sessions[key] = requests.Session()
+        session.verify = False
+        cassette = active_cassette()
+        if cassette is not None:
+            cassette.attach(session)
+    return session
+
+
 def send_get_request(site_url):
     site_response = None
 
     try:
-        # Suppress only the single warning from urllib3 needed.
-        requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
-        site_response = requests.get(site_url, verify=False)
+        with timed("http", f"GET {site_url}"):
+            site_response = _session_for(site_url).get(site_url, verify=False)
     except (ConnectionError, HTTPError, RequestException) as e:
         logger.exception(
             "Failed to connect %s due to refused connection or unsuccessful status code %s",
@@ -37,77 +67,121 @@ def send_get_request(site_url):
     return site_response
 
 
+def probe_endpoints(endpoints, wait=True, timeout_minutes=10, max_workers=8):
+    """
+    Probe several URLs concurrently.
+
+    Args:
+        endpoints: Dictionary mapping each URL to its acceptable HTTP status codes
+            (None for the wait_for default of [200, 401])
+        wait: If True, retry each URL like wait_for until it returns an acceptable
+            status code; if False, send a single request (default: True)
+        timeout_minutes: Maximum time to wait per URL in minutes (default: 10)
+        max_workers: Maximum number of URLs probed at the same time (default: 8)
+
+    Returns:
+        A dictionary mapping each URL, in the given order, to a dictionary containing:
+            - response: The last response, or None if the request failed
+            - status_code: The status code of the last response, or None
+            - latency: Seconds the last request took, or None
+            - waited: Seconds spent on the URL in total
+            - success: Boolean indicating if the status code is acceptable
+    """
+
+    def probe(item):
+        url, codes = item
+        if codes is None:
+            codes = [requests.codes.ok, requests.codes.unauthorized]
+        start = time.monotonic()
+        if wait:
+            rsp = wait_for(
+                app_url=url,
+                timeout_minutes=timeout_minutes,
+                acceptable_status_codes=codes,
+            )
+        else:
+            rsp = send_get_request(site_url=url)
+        return url, {
+            "response": rsp,
+            "status_code": rsp.status_code if rsp is not None else None,
+            "latency": rsp.elapsed.total_seconds() if rsp is not None else None,
+            "waited": time.monotonic() - start,
+            "success": rsp is not None and rsp.status_code in codes,
+        }
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = dict(pool.map(probe, endpoints.items()))
+
+    for url, result in results.items():
+        latency = result["latency"]
+        logger.info(
+            f"{result['status_code']} "
+            f"{'-' if latency is None else f'{latency:.3f}s'} "
+            f"(waited {result['waited']:.1f}s) {url}"
+        )
+    return results
+
+
+def _containers_running(pod_instance):
+    for container in pod_instance.status.containerStatuses or []:
+        if container.state.terminated:
+            if container.state.terminated.reason != Resource.Status.COMPLETED:
+                return False
+        elif not container.state.running:
+            return False
+    return True
+
+
 def verify_pod_in_project(openshift_dyn_client, project, pod):
     pod_name = pod
     logger.debug(f'Verify pod "{pod}" in project "{project}"')
-    pod = Pod(client=openshift_dyn_client, namespace=project, name=pod_name)
-    if pod.exists:
-        for container in pod.instance.status.containerStatuses:
-            if container.state.terminated:
-                if container.state.terminated.reason != Resource.Status.COMPLETED:
-                    return False
-            elif not container.state.running:
-                return False
-        return True
+    instance = Pod(client=openshift_dyn_client, namespace=project, name=pod_name).exists
+    if instance:
+        return _containers_running(instance)
     return False
 
 
 def verify_pod_by_deployment(openshift_dyn_client, project, deployment):
-    rs = None
-    pod = None
-    try:
-        replicasets = ReplicaSet.get(dyn_client=openshift_dyn_client, namespace=project)
-        rs = _get_resource_by_owner(deployment, replicasets)
-        if rs.instance.spec.replicas == 0:
-            return True
-        pods = Pod.get(dyn_client=openshift_dyn_client, namespace=project)
-        pod = _get_resource_by_owner(rs.name, pods)
-        logger.debug(f'Found matching pod: "{pod.name}"')
-        return verify_pod_in_project(
-            openshift_dyn_client=openshift_dyn_client, project=project, pod=pod.name
-        )
-    except StopIteration:
-        raise
+    replicasets = snapshot_cache.list(ReplicaSet, openshift_dyn_client, project)
+    rs = _get_resource_by_owner(deployment, replicasets)
+    if rs.spec.replicas == 0:
+        return True
+    pods = snapshot_cache.list(Pod, openshift_dyn_client, project)
+    pod = _get_resource_by_owner(rs.metadata.name, pods)
+    logger.debug(f'Found matching pod: "{pod.metadata.name}"')
+    return _containers_running(pod)
 
 
 def _get_resource_by_owner(owner, resources):
-    try:
-        for res in resources:
-            res_owner = res.instance.metadata.ownerReferences[0].name
-            logger.debug(f"Current Resource: {res.name} Owner: {res_owner}")
-            if res_owner == owner:
-                return res
-        return None
-    except StopIteration:
-        raise
+    for res in resources:
+        owners = res.metadata.ownerReferences or []
+        res_owner = owners[0].name if owners else None
+        logger.debug(f"Current Resource: {res.metadata.name} Owner: {res_owner}")
+        if res_owner == owner:
+            return res
+    return None
 
 
 def get_route_by_app_label(openshift_dyn_client, project, label):
     label = label.split("=")
-    matches = []
-    try:
-        routes = Route.get(dyn_client=openshift_dyn_client, namespace=project)
-        for route in routes:
-            if label[0] in route.labels.keys():
-                if route.labels[label[0]] == label[-1]:
-                    matches.append(route)
-        if len(matches) > 0:
-            return matches
-        return None
-    except StopIteration:
-        raise
+    routes = snapshot_cache.list(
+        Route,
+        openshift_dyn_client,
+        project,
+        label_selector=f"{label[0]}={label[-1]}",
+    )
+    matches = [
+        Route(client=openshift_dyn_client, name=route.metadata.name, namespace=project)
+        for route in routes
+    ]
+    if len(matches) > 0:
+        return matches
+    return None
 
 
 def verify_project(openshift_dyn_client, project_name):
-    try:
-        projects = Project.get(dyn_client=openshift_dyn_client)
-        for project in projects:
-            if project.name == project_name:
-                if project.status == Project.Status.ACTIVE:
-                    return True
-    except StopIteration:
-        raise
-    return False
+    project = snapshot_cache.get(Project, openshift_dyn_client, project_name)
+    return project is not None and project.status.phase == Project.Status.ACTIVE
 
 
 def git_submit_and_push(path, working_dir, commit_message, push=True):
@@ -127,16 +201,45 @@ def git_submit_and_push(path, working_dir, commit_message, push=True):
     logger.info(push.stderr)
 
 
+def backoff_delays(initial_delay=1, max_delay=30, factor=2):
+    """Yield delays growing exponentially from initial_delay, capped at max_delay."""
+    delay = initial_delay
+    while True:
+        yield min(delay, max_delay)
+        delay *= factor
+
+
+def poll(probe, done, timeout, initial_delay=1, max_delay=30):
+    """Call probe() until done(result) is true or timeout seconds have passed.
+
+    The first call is made at once; the pauses after it grow exponentially
+    from initial_delay up to max_delay and never extend past the deadline.
+    Returns the last result.
+    """
+    deadline = time.monotonic() + timeout
+    delays = backoff_delays(initial_delay, max_delay)
+    for attempt, delay in enumerate(delays, 1):
+        logger.info(f"Attempt #{attempt}...")
+        result = probe()
+        remaining = deadline - time.monotonic()
+        if done(result) or remaining <= 0:
+            return result
+        time.sleep(min(delay, remaining))
+
+
 def wait_for(
     app_url, timeout_minutes=10, sleep_seconds=30, acceptable_status_codes=None
 ):
     """
     Wait for a URL to become available by polling it until it returns an acceptable status code.
 
+    The first request is sent immediately; the time between attempts then
+    doubles from 1 second up to sleep_seconds.
+
     Args:
         app_url: The URL to poll
         timeout_minutes: Maximum time to wait in minutes (default: 10)
-        sleep_seconds: Time to wait between attempts in seconds (default: 30)
+        sleep_seconds: Maximum time to wait between attempts in seconds (default: 30)
         acceptable_status_codes: List of acceptable HTTP status codes (default: [200, 401])
 
     Returns:
@@ -145,24 +248,97 @@ def wait_for(
     if acceptable_status_codes is None:
         acceptable_status_codes = [requests.codes.ok, requests.codes.unauthorized]
 
-    counter = 0
-    timeout = time.time() + 60 * timeout_minutes
+    def available(rsp):
+        return rsp is not None and rsp.status_code in acceptable_status_codes
+
     logger.debug(f"Waiting for URL: {app_url} (timeout: {timeout_minutes} minutes)")
+    with timed("wait", app_url):
+        rsp = poll(
+            lambda: send_get_request(site_url=app_url),
+            available,
+            timeout=60 * timeout_minutes,
+            max_delay=sleep_seconds,
+        )
 
-    while time.time() < timeout:
-        time.sleep(sleep_seconds)
-        counter += 1
-        logger.info(f"Attempt #{counter}...")
-        rsp = send_get_request(site_url=app_url)
+    if available(rsp):
+        logger.debug(f"Successfully received status {rsp.status_code} from {app_url}")
+    else:
+        logger.warning(f"Timeout reached waiting for {app_url}")
+    return rsp
 
-        if rsp is not None and rsp.status_code in acceptable_status_codes:
-            logger.debug(
-                f"Successfully received status {rsp.status_code} from {app_url}"
-            )
-            return rsp
 
-    logger.warning(f"Timeout reached waiting for {app_url}")
-    return rsp
+def wait_for_resource(resource, done, timeout=300):
+    """
+    Wait until done(instance) is true for a resource, using a watch stream.
+
+    The resource is read once first, so one already in the wanted state
+    returns at once; after that, its changes are streamed from the API
+    server rather than polled.  instance is None while the resource does not
+    exist.
+
+    Args:
+        resource: The ocp_resources object to wait for
+        done: Predicate called with each new instance (or None)
+        timeout: Maximum time to wait in seconds (default: 300)
+
+    Returns:
+        The last instance seen (or None); call done() on it to tell success
+        from a timeout
+    """
+    with timed("wait", f"{resource.kind} {resource.name}"):
+        return _watch_until(resource, done, timeout)
+
+
+def _watch_until(resource, done, timeout):
+    deadline = time.monotonic() + timeout
+    delays = backoff_delays()
+    namespace = getattr(resource, "namespace", None)
+    while True:
+        instance = resource.exists
+        remaining = int(deadline - time.monotonic())
+        if done(instance) or remaining <= 0:
+            break
+        version = instance.metadata.resourceVersion if instance else None
+        try:
+            for event in resource.api.watch(
+                namespace=namespace,
+                name=resource.name,
+                resource_version=version,
+                timeout=remaining,
+            ):
+                if event["type"] == "ERROR":
+                    # A Status such as 410 Gone (resourceVersion too old);
+                    # re-read the resource and watch again
+                    raise ApiException(reason=str(event.get("raw_object")))
+                instance = None if event["type"] == "DELETED" else event["object"]
+                if done(instance):
+                    return instance
+        except ApiException as e:
+            logger.debug(f"Watch of {resource.kind} {resource.name} ended: {e}")
+            time.sleep(min(next(delays), max(deadline - time.monotonic(), 0)))
+
+    if not done(instance):
+        logger.warning(f"Timeout reached waiting for {resource.kind} {resource.name}")
+    return instance
+
+
+def wait_for_phase(resource, phase, timeout=300):
+    """Wait for a resource's status.phase to be phase; return True if it is."""
+
+    def in_phase(instance):
+        return bool(instance and instance.status and instance.status.phase == phase)
+
+    return in_phase(wait_for_resource(resource, in_phase, timeout=timeout))
+
+
+def wait_for_resource_condition(resource, condition, status="True", timeout=300):
+    """Wait for a status condition of a resource to have status; return True if so."""
+
+    def met(instance):
+        conditions = instance and instance.status and instance.status.conditions
+        return any(c.type == condition and c.status == status for c in conditions or [])
+
+    return met(wait_for_resource(resource, met, timeout=timeout))
 
 
 def run_cmds(cmds, cwd=None, timeout=300):